@@ -0,0 +1,99 @@
+"""Benchmark loading records to Db2 with each `load_engine`.
+
+Loads batches of generated records to a table without key properties, once
+with INSERT statements and once with the LOAD utility, on a Db2 database, e.g.
+the local container of the tests:
+
+    python benchmark_load_engine.py --rows 1000000 --batch-size 100000
+
+The file engines are timed too when given a directory the server reads:
+
+    python benchmark_load_engine.py --bulk-load-directory ./shared
+        --bulk-load-server-directory /shared
+"""
+
+from __future__ import annotations
+
+import time
+from argparse import ArgumentParser
+
+import sqlalchemy as sa
+
+from target_db2.connector import Db2Sink
+from target_db2.target import TargetDb2
+
+parser = ArgumentParser()
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--batch-size", type=int, default=100_000)
+parser.add_argument("--host", default="localhost")
+parser.add_argument("--port", type=int, default=50000)
+parser.add_argument("--user", default="db2inst1")
+parser.add_argument("--password", default="pass1")
+parser.add_argument("--database", default="testdb")
+parser.add_argument("--bulk-load-directory")
+parser.add_argument("--bulk-load-server-directory")
+
+SCHEMA = {
+    "properties": {
+        "id": {"type": ["integer"]},
+        "name": {"type": ["string", "null"]},
+        "amount": {"type": ["number", "null"]},
+        "created_at": {"type": ["string", "null"], "format": "date-time"},
+        "attributes": {"type": ["object", "null"]},
+    }
+}
+
+
+def run(config: dict, engine: str, rows: int, batch_size: int) -> None:
+    """Load `rows` records in batches with `engine`, and print the throughput."""
+    target = TargetDb2(config={**config, "load_engine": engine})
+    sink = Db2Sink(target, f"benchmark_{engine}", SCHEMA, [])
+    sink.setup()
+    elapsed = 0.0
+    for start in range(0, rows, batch_size):
+        context: dict = {}
+        sink.start_batch(context)
+        for i in range(start, min(start + batch_size, rows)):
+            sink.process_record(
+                {
+                    "id": i,
+                    "name": f"name-{i}",
+                    "amount": i / 100,
+                    "created_at": "2024-01-01T00:00:00+00:00",
+                    "attributes": {"color": "red", "size": i % 10},
+                },
+                context,
+            )
+        batch_start = time.perf_counter()
+        sink.process_batch(context)
+        elapsed += time.perf_counter() - batch_start
+        sink.mark_drained()
+    print(f"{engine:<18} {elapsed:8.2f}s {rows / elapsed:12,.0f} rows/s")  # noqa: T201
+    with sink.connector._connect() as conn, conn.begin():  # noqa: SLF001
+        conn.execute(
+            sa.text(f"DROP TABLE {sink.connector.quote(sink.full_table_name)}")
+        )
+
+
+def main() -> None:
+    """Time each load engine."""
+    args = parser.parse_args()
+    config = {
+        "host": args.host,
+        "port": args.port,
+        "user": args.user,
+        "password": args.password,
+        "database": args.database,
+        "add_record_metadata": False,
+    }
+    engines = ["insert", "load_from_cursor"]
+    if args.bulk_load_directory:
+        config["bulk_load_directory"] = args.bulk_load_directory
+        config["bulk_load_server_directory"] = args.bulk_load_server_directory
+        engines += ["load_from_file", "import_from_file"]
+    for engine in engines:
+        run(config, engine, args.rows, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark decoding of Singer messages by target-db2 against the SDK default.
+
+Generates a Singer file of RECORD messages of the requested size, unless it
+already exists, then times reading & parsing every message of the file:
+
+    python benchmark_message_reader.py --path /tmp/singer.jsonl --size-mb 4096
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from singer_sdk._singerlib.encoding import SimpleSingerReader
+
+from target_db2.target import TargetDb2
+
+parser = ArgumentParser()
+parser.add_argument("--path", type=Path, default=Path("singer_benchmark.jsonl"))
+parser.add_argument("--size-mb", type=int, default=2048)
+
+CONFIG = {
+    "host": "localhost",
+    "port": 50000,
+    "user": "db2inst1",
+    "password": "pass1",
+    "database": "testdb",
+}
+
+
+def generate(path: Path, size: int) -> None:
+    """Write RECORD messages to `path` until it holds `size` bytes."""
+    written = 0
+    with path.open("w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "type": "SCHEMA",
+                    "stream": "benchmark",
+                    "schema": {"properties": {"id": {"type": "integer"}}},
+                    "key_properties": ["id"],
+                }
+            )
+            + "\n"
+        )
+        i = 0
+        while written < size:
+            line = (
+                json.dumps(
+                    {
+                        "type": "RECORD",
+                        "stream": "benchmark",
+                        "record": {
+                            "id": i,
+                            "name": f"name-{i}",
+                            "amount": round(random.uniform(0, 10000), 2),  # noqa: S311
+                            "created_at": "2024-01-01T00:00:00+00:00",
+                            "tags": ["a", "b", "c"],
+                            "attributes": {"color": "red", "size": i % 10},
+                        },
+                        "time_extracted": "2024-01-01T00:00:00+00:00",
+                    }
+                )
+                + "\n"
+            )
+            f.write(line)
+            written += len(line)
+            i += 1
+
+
+def run(name: str, lines: int, size: int, start: float) -> None:
+    """Print the throughput of a reader."""
+    elapsed = time.perf_counter() - start
+    print(  # noqa: T201
+        f"{name:<22} {elapsed:8.2f}s {lines / elapsed:12,.0f} lines/s "
+        f"{size / elapsed / 1024 / 1024:8.1f} MB/s"
+    )
+
+
+def main() -> None:
+    """Generate the file if needed, then time each reader."""
+    args = parser.parse_args()
+    if not args.path.exists():
+        generate(args.path, args.size_mb * 1024 * 1024)
+    size = args.path.stat().st_size
+
+    # the SDK's reader, bypassing the override of target-db2
+    target = TargetDb2(config=CONFIG)
+    start = time.perf_counter()
+    with args.path.open() as f:
+        count = sum(
+            1 for line in f if SimpleSingerReader.deserialize_json(target, line)
+        )
+    run("sdk", count, size, start)
+
+    for library in ("json", "msgspec", "orjson"):
+        try:
+            target = TargetDb2(config={**CONFIG, "json_deserializer": library})
+        except ImportError:
+            continue
+        start = time.perf_counter()
+        with args.path.open() as f:
+            count = sum(
+                1
+                for line in target._read_lines(f)  # noqa: SLF001
+                if target.deserialize_json(line)
+            )
+        run(f"target-db2 ({library})", count, size, start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Vectorized conversion of buffered columns with Apache Arrow, if installed."""
+
+from __future__ import annotations
+
+import importlib.util
+import typing as t
+
+# strings parsed by Arrow, in the formats of Singer taps; other strings are
+# left to the caller
+DATETIME_PATTERN = (
+    r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?(Z|[+-]\d{2}:\d{2})?$"
+)
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+ZONE_OFFSET_PATTERN = r"(Z|[+-]\d{2}:\d{2})$"
+
+
+def arrow_installed() -> bool:
+    """Check if `pyarrow` is installed."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def parse_datelike(
+    values: list[t.Any],
+    datelike_type: str,
+) -> tuple[list[t.Any], list[int]]:
+    """Parse a column of ISO 8601 strings at once, keeping nulls.
+
+    Strings are matched, stripped of their zone offset & parsed by Arrow in
+    native code, rather than one at a time in Python. Date-times are so naive,
+    at the wall-clock time of their offset, as written to Db2 when parsed by
+    the SDK. Strings of other formats are not parsed, but their positions are
+    returned, for the caller to parse them.
+
+    Args:
+        values: The strings, or None.
+        datelike_type: `date-time` or `date`.
+
+    Returns:
+        The parsed `datetime` or `date` values, None for strings not parsed,
+        and the positions of the strings not parsed.
+
+    Raises:
+        ValueError: If a matched string is not a valid date, e.g. 2024-02-30.
+        TypeError: If a value is not a string.
+    """
+    import pyarrow as pa  # type: ignore[import-not-found]
+    import pyarrow.compute as pc  # type: ignore[import-not-found]
+
+    strings = pa.array(values, type=pa.string())
+    if datelike_type == "date-time":
+        matched = pc.match_substring_regex(strings, DATETIME_PATTERN)
+        strings = pc.replace_substring_regex(
+            strings, pattern=ZONE_OFFSET_PATTERN, replacement=""
+        )
+        arrow_type = pa.timestamp("us")
+    else:
+        matched = pc.match_substring_regex(strings, DATE_PATTERN)
+        arrow_type = pa.date32()
+    # null values are not matched, and stay null
+    matched = pc.fill_null(matched, fill_value=False)
+    unparsed = pc.indices_nonzero(pc.and_not(pc.is_valid(strings), matched))
+    try:
+        parsed = pc.if_else(matched, strings, pa.scalar(None, pa.string()))
+        parsed = parsed.cast(arrow_type)
+    except pa.ArrowNotImplementedError as e:
+        raise ValueError(str(e)) from e
+    if importlib.util.find_spec("numpy") is None:
+        return parsed.to_pylist(), unparsed.to_pylist()
+    # through NumPy, without creating an Arrow scalar per value
+    return parsed.to_numpy(zero_copy_only=False).tolist(), unparsed.to_pylist()
@@ -0,0 +1,83 @@
+"""Reading of the records of Singer BATCH files, one record at a time."""
+
+from __future__ import annotations
+
+import gzip
+import importlib.util
+import typing as t
+
+from singer_sdk.helpers._batch import BatchFileFormat
+
+if t.TYPE_CHECKING:
+    from singer_sdk.helpers._batch import BaseBatchFileEncoding
+
+    from target_db2.serializers import JSONDeserializer
+
+# rows decoded at once from a Parquet file
+PARQUET_BATCH_ROWS = 10000
+
+
+def read_jsonl(
+    file: t.IO[bytes],
+    deserialize: JSONDeserializer,
+    compression: str | None = None,
+) -> t.Iterator[dict[str, t.Any]]:
+    """Read the records of a JSON Lines file, decompressing it as it is read.
+
+    Args:
+        file: The file, opened in binary mode.
+        deserialize: Parses a line of bytes to a record.
+        compression: `gzip`, or None if the file is not compressed.
+
+    Yields:
+        The records, in file order.
+    """
+    lines = gzip.GzipFile(fileobj=file, mode="rb") if compression == "gzip" else file
+    for line in lines:
+        if not line.isspace():
+            yield deserialize(line)
+
+
+def read_parquet(file: t.IO[bytes]) -> t.Iterator[dict[str, t.Any]]:
+    """Read the records of a Parquet file, `PARQUET_BATCH_ROWS` rows at a time.
+
+    Args:
+        file: The file, opened in binary mode.
+
+    Yields:
+        The records, in file order.
+    """
+    import pyarrow.parquet as pq  # type: ignore[import-not-found]
+
+    for batch in pq.ParquetFile(file).iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        yield from batch.to_pylist()
+
+
+def read_batch_file(
+    file: t.IO[bytes],
+    encoding: BaseBatchFileEncoding,
+    deserialize: JSONDeserializer,
+) -> t.Iterator[dict[str, t.Any]]:
+    """Read the records of a batch file of the given encoding.
+
+    Args:
+        file: The file, opened in binary mode.
+        encoding: The encoding of the BATCH message.
+        deserialize: Parses a line of JSON Lines files to a record.
+
+    Returns:
+        An iterator of the records, read as it is consumed.
+
+    Raises:
+        NotImplementedError: If the format is not supported, or is Parquet and
+            `pyarrow` is not installed.
+    """
+    if encoding.format == BatchFileFormat.JSONL:
+        return read_jsonl(file, deserialize, encoding.compression)
+    if encoding.format == BatchFileFormat.PARQUET:
+        if importlib.util.find_spec("pyarrow") is None:
+            msg = "Parquet batch files require `pyarrow` to be installed."
+            raise NotImplementedError(msg)
+        return read_parquet(file)
+    msg = f"Unsupported batch encoding format: {encoding.format}"
+    raise NotImplementedError(msg)
@@ -0,0 +1,133 @@
+"""Batch sizing helpers for Db2 sinks."""
+
+from __future__ import annotations
+
+import time
+import typing as t
+from contextlib import contextmanager
+
+if t.TYPE_CHECKING:
+    from logging import Logger
+
+GROWTH_FACTOR = 1.5
+# ignore batches much smaller than the current size, e.g. drained on age
+# or at the end of the stream, since their throughput is not representative
+MIN_SAMPLE_FILL = 0.5
+# tolerated throughput drop before growth is considered harmful
+THROUGHPUT_TOLERANCE = 0.95
+
+
+class PhaseTimer:
+    """Accumulate wall-clock seconds spent in each phase of a batch."""
+
+    def __init__(self) -> None:
+        """Initialize the timer."""
+        self.seconds: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> t.Iterator[None]:
+        """Time the enclosed block as part of phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+
+    @property
+    def total(self) -> float:
+        """Total seconds across all phases."""
+        return sum(self.seconds.values())
+
+
+class AdaptiveBatchSizer:
+    """Choose the next batch size from measured Db2 throughput.
+
+    After each batch the size grows while throughput keeps improving and the
+    projected batch latency stays under `target_latency`. It shrinks in
+    proportion when a batch exceeds `target_latency`, and holds otherwise.
+    The size always stays within `[min_size, max_size]`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        initial_size: int,
+        min_size: int,
+        max_size: int,
+        target_latency: float,
+        logger: Logger,
+    ) -> None:
+        """Initialize the sizer.
+
+        Args:
+            initial_size: Batch size to start with.
+            min_size: Lower bound of the batch size.
+            max_size: Upper bound of the batch size.
+            target_latency: Max seconds a batch should take to load.
+            logger: Logger used to report sizing decisions.
+        """
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.target_latency = target_latency
+        self.logger = logger
+        self.batch_size = self._clamp(initial_size)
+        self._last_throughput: float | None = None
+
+    def _clamp(self, size: float) -> int:
+        return int(min(self.max_size, max(self.min_size, size)))
+
+    def record_batch(self, rows: int, timer: PhaseTimer) -> int:
+        """Record a loaded batch and compute the next batch size.
+
+        Args:
+            rows: Number of rows in the batch.
+            timer: Seconds spent per phase loading the batch.
+
+        Returns:
+            The next batch size.
+        """
+        latency = timer.total
+        if not rows or latency <= 0:
+            return self.batch_size
+        throughput = rows / latency
+        phases = ", ".join(f"{k}={v:.3f}s" for k, v in timer.seconds.items())
+        self.logger.info(
+            "Loaded %d rows in %.3fs (%.0f rows/s; %s)",
+            rows,
+            latency,
+            throughput,
+            phases,
+        )
+
+        current_size = self.batch_size
+        if latency > self.target_latency:
+            self.batch_size = self._clamp(
+                current_size * self.target_latency / latency,
+            )
+            reason = f"latency above target of {self.target_latency}s"
+        elif rows < current_size * MIN_SAMPLE_FILL:
+            reason = "batch too small to be representative"
+        elif (
+            self._last_throughput is not None
+            and throughput < self._last_throughput * THROUGHPUT_TOLERANCE
+        ):
+            reason = "throughput did not improve"
+        elif latency * GROWTH_FACTOR > self.target_latency:
+            reason = "growing would exceed latency target"
+        else:
+            self.batch_size = self._clamp(current_size * GROWTH_FACTOR)
+            reason = "throughput improving"
+
+        if rows >= current_size * MIN_SAMPLE_FILL:
+            self._last_throughput = throughput
+
+        if self.batch_size != current_size:
+            self.logger.info(
+                "Batch size changed from %d to %d: %s.",
+                current_size,
+                self.batch_size,
+                reason,
+            )
+        else:
+            self.logger.debug("Batch size kept at %d: %s.", current_size, reason)
+        return self.batch_size
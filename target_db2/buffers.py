@@ -0,0 +1,337 @@
+"""Buffers holding the records of a batch until it is drained."""
+
+from __future__ import annotations
+
+import pickle
+import tempfile
+import typing as t
+from itertools import islice
+
+SPILL_FILE_BUFFER_SIZE = 1024 * 1024
+
+_T = t.TypeVar("_T")
+
+
+def chunked(records: t.Iterable[_T], size: int) -> t.Iterator[list[_T]]:
+    """Split records into lists of at most `size` records."""
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class RecordBuffer:
+    """Buffer records of a batch in memory.
+
+    When `key_properties` are given, records are deduplicated as they are
+    added: a record replaces the buffered record with the same key, in its
+    slot. Only the last record of each key is held, and no deduplication is
+    needed when the batch is drained. With `merge_duplicates`, the record is
+    merged into the buffered record instead, keeping properties it lacks.
+
+    Memory used by the records is only estimated with a `size_estimator`,
+    e.g. when buffered memory is budgeted. A record replacing another is
+    estimated at the size of the record it replaces.
+    """
+
+    def __init__(
+        self,
+        key_properties: t.Sequence[str] | None = None,
+        *,
+        merge_duplicates: bool = False,
+        size_estimator: t.Callable[[dict[str, t.Any]], int] | None = None,
+    ) -> None:
+        """Initialize the buffer.
+
+        Args:
+            key_properties: Properties identifying a record, if any.
+            merge_duplicates: Merge records with the same key, for partial
+                records.
+            size_estimator: Estimates the memory used by a record, in bytes.
+        """
+        self._key_properties = list(key_properties or [])
+        self._merge_duplicates = merge_duplicates
+        self._size_estimator = size_estimator
+        self._key_slots: dict[tuple, int] = {}
+        self._records: list[dict[str, t.Any]] = []
+        self.nbytes = 0
+        """Approximate memory used by the buffered records, in bytes."""
+
+    def _record_key(self, record: dict[str, t.Any]) -> tuple | None:
+        """Return the key of the record, or None if there are no key properties."""
+        if not self._key_properties:
+            return None
+        return tuple([record[k] for k in self._key_properties])
+
+    def _find_slot(self, record: dict[str, t.Any], new_slot: int) -> int | None:
+        """Return the slot of the record's key, indexing it at `new_slot` if new.
+
+        Returns:
+            The slot of the buffered record with the same key, or None.
+        """
+        key = self._record_key(record)
+        if key is None:
+            return None
+        slot = self._key_slots.setdefault(key, new_slot)
+        return None if slot == new_slot else slot
+
+    def append(self, record: dict[str, t.Any]) -> bool:
+        """Add a record to the buffer.
+
+        Returns:
+            True if the record replaced a buffered record with the same key.
+        """
+        slot = self._find_slot(record, len(self._records))
+        if slot is None:
+            if self._size_estimator:
+                self.nbytes += self._size_estimator(record)
+            self._records.append(record)
+            return False
+        if self._merge_duplicates:
+            record = {**self._records[slot], **record}
+        self._records[slot] = record
+        return True
+
+    def __len__(self) -> int:
+        """Number of records in the buffer."""
+        return len(self._records)
+
+    def __iter__(self) -> t.Iterator[dict[str, t.Any]]:
+        """Iterate over the records, in the order they were added."""
+        return iter(self._records)
+
+    def close(self) -> None:
+        """Release the records held by the buffer."""
+        self._records = []
+        self._key_slots = {}
+        self.nbytes = 0
+
+
+class SpillRecordBuffer(RecordBuffer):
+    """Buffer records of a batch in a temporary file.
+
+    Records are pickled to the file as they arrive, and unpickled one at a time
+    when iterated, so memory use does not grow with the size of the batch.
+    Records replaced by a record with the same key stay in the file, but are
+    skipped when iterating. Records must not be added once iteration started.
+    """
+
+    def __init__(
+        self,
+        key_properties: t.Sequence[str] | None = None,
+        directory: str | None = None,
+    ) -> None:
+        """Initialize the buffer.
+
+        Args:
+            key_properties: Properties identifying a record, if any.
+            directory: Directory of the temporary file, defaults to the system's.
+        """
+        super().__init__(key_properties)
+        self._file = tempfile.TemporaryFile(
+            buffering=SPILL_FILE_BUFFER_SIZE,
+            dir=directory,
+        )
+        self._count = 0
+        self._replaced: set[int] = set()
+
+    def append(self, record: dict[str, t.Any]) -> bool:
+        """Add a record to the buffer.
+
+        Returns:
+            True if the record replaced a buffered record with the same key.
+        """
+        replaced = False
+        key = self._record_key(record)
+        if key is not None:
+            slot = self._key_slots.get(key)
+            if slot is not None:
+                self._replaced.add(slot)
+                replaced = True
+            self._key_slots[key] = self._count
+        self._file.write(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+        self._count += 1
+        return replaced
+
+    def __len__(self) -> int:
+        """Number of records in the buffer."""
+        return self._count - len(self._replaced)
+
+    def __iter__(self) -> t.Iterator[dict[str, t.Any]]:
+        """Iterate over the records, in the order they were added."""
+        self._file.flush()
+        self._file.seek(0)
+        unpickler = pickle.Unpickler(self._file)  # noqa: S301
+        for i in range(self._count):
+            record = unpickler.load()
+            if i not in self._replaced:
+                yield record
+
+    def close(self) -> None:
+        """Delete the temporary file."""
+        super().close()
+        self._file.close()
+        self._count = 0
+        self._replaced = set()
+
+
+class StreamedRecordBuffer(RecordBuffer):
+    """Pass the records of an iterable through, without holding them.
+
+    Records are read from the iterable as the buffer is iterated, which may
+    only happen once, e.g. to stream the records of a batch file to the
+    database. Records are not deduplicated, so this suits streams without key
+    properties.
+    """
+
+    def __init__(self, records: t.Iterable[dict[str, t.Any]]) -> None:
+        """Initialize the buffer.
+
+        Args:
+            records: The records, read once.
+        """
+        super().__init__()
+        self._source = iter(records)
+        self._count = 0
+
+    def append(self, record: dict[str, t.Any]) -> bool:  # noqa: ARG002
+        """Records cannot be added to a streamed buffer.
+
+        Raises:
+            NotImplementedError: Always.
+        """
+        msg = "Records cannot be added to a streamed buffer."
+        raise NotImplementedError(msg)
+
+    def __len__(self) -> int:
+        """Number of records read so far."""
+        return self._count
+
+    def __iter__(self) -> t.Iterator[dict[str, t.Any]]:
+        """Iterate over the records, reading them from the iterable."""
+        for record in self._source:
+            self._count += 1
+            yield record
+
+    def close(self) -> None:
+        """Stop reading records."""
+        super().close()
+        self._source = iter(())
+
+
+class ColumnarRecordBuffer(RecordBuffer):
+    """Buffer records of a batch as one list of values per column.
+
+    Values are stored in the slot of their record in each column's list, so
+    property names are not repeated for every record. Properties not in
+    `columns` are dropped.
+    """
+
+    def __init__(
+        self,
+        columns: t.Sequence[str],
+        key_properties: t.Sequence[str] | None = None,
+        *,
+        size_estimator: t.Callable[[dict[str, t.Any]], int] | None = None,
+    ) -> None:
+        """Initialize the buffer.
+
+        Args:
+            columns: Names of the properties to buffer.
+            key_properties: Properties identifying a record, if any.
+            size_estimator: Estimates the memory used by a record, in bytes.
+        """
+        super().__init__(key_properties, size_estimator=size_estimator)
+        self._columns: dict[str, list[t.Any]] = {c: [] for c in columns}
+        self._count = 0
+
+    def append(self, record: dict[str, t.Any]) -> bool:
+        """Add a record to the buffer.
+
+        Returns:
+            True if the record replaced a buffered record with the same key.
+        """
+        slot = self._find_slot(record, self._count)
+        if slot is None:
+            for name, values in self._columns.items():
+                values.append(record.get(name))
+            if self._size_estimator:
+                self.nbytes += self._size_estimator(record)
+            self._count += 1
+            return False
+        for name, values in self._columns.items():
+            values[slot] = record.get(name)
+        return True
+
+    def __len__(self) -> int:
+        """Number of records in the buffer."""
+        return self._count
+
+    def __iter__(self) -> t.Iterator[dict[str, t.Any]]:
+        """Iterate over the records, as dictionaries."""
+        names = list(self._columns)
+        for row in self.rows(names):
+            yield dict(zip(names, row))
+
+    def map_column(self, name: str, func: t.Callable[[t.Any], t.Any]) -> None:
+        """Replace every value of column `name` by `func(value)`."""
+        self._columns[name] = [func(v) for v in self._columns[name]]
+
+    def rows(self, columns: t.Sequence[str]) -> t.Iterator[tuple]:
+        """Iterate over the records as tuples of the values of `columns`."""
+        return zip(*[self._columns[name] for name in columns])
+
+    def close(self) -> None:
+        """Release the records held by the buffer."""
+        super().close()
+        for values in self._columns.values():
+            values.clear()
+        self._count = 0
+
+
+class ConvertedColumnarRecordBuffer(ColumnarRecordBuffer):
+    """Buffer records as columns, converting whole columns when first read.
+
+    Values of the columns of `converters` are buffered as added, e.g. as
+    date-time strings, and each column is replaced by `converter(values)`
+    when the records are first read, so it is converted at once, e.g. by
+    Arrow. Records must not be added once the buffer was read.
+    """
+
+    def __init__(
+        self,
+        columns: t.Sequence[str],
+        key_properties: t.Sequence[str] | None = None,
+        converters: dict[str, t.Callable[[list[t.Any]], list[t.Any]]] | None = None,
+        *,
+        size_estimator: t.Callable[[dict[str, t.Any]], int] | None = None,
+    ) -> None:
+        """Initialize the buffer.
+
+        Args:
+            columns: Names of the properties to buffer.
+            key_properties: Properties identifying a record, if any.
+            converters: Functions converting the values of a column, by name.
+            size_estimator: Estimates the memory used by a record, in bytes.
+        """
+        super().__init__(columns, key_properties, size_estimator=size_estimator)
+        self._converters = {
+            name: converter
+            for name, converter in (converters or {}).items()
+            if name in self._columns
+        }
+
+    def _convert(self) -> None:
+        """Convert the columns of `converters`, once."""
+        for name, converter in self._converters.items():
+            self._columns[name] = converter(self._columns[name])
+        self._converters = {}
+
+    def map_column(self, name: str, func: t.Callable[[t.Any], t.Any]) -> None:
+        """Replace every value of column `name` by `func(value)`."""
+        self._convert()
+        super().map_column(name, func)
+
+    def rows(self, columns: t.Sequence[str]) -> t.Iterator[tuple]:
+        """Iterate over the records as tuples of the values of `columns`."""
+        self._convert()
+        return super().rows(columns)
@@ -2,32 +2,94 @@
 
 from __future__ import annotations
 
+import datetime
+import hashlib
 import json
 import math
+import posixpath
 import re
+import tempfile
+import time
 import typing as t
+from collections import Counter
+from functools import cached_property, partial
+from pathlib import Path
 from random import choice
 from string import ascii_lowercase
 from textwrap import dedent
 
 import sqlalchemy as sa
 from singer_sdk.connectors import SQLConnector
+from singer_sdk.exceptions import ConformedNameClashException
+from singer_sdk.helpers._batch import BaseBatchFileEncoding, StorageTarget
 from singer_sdk.helpers._conformers import replace_leading_digit
 from singer_sdk.helpers._typing import get_datelike_property_type
+from singer_sdk.helpers._util import utc_now
 from singer_sdk.helpers.capabilities import TargetLoadMethods
 from singer_sdk.sinks import SQLSink
 from singer_sdk.typing import _jsonschema_type_check
 from sqlalchemy.sql import quoted_name  # type: ignore[attr-defined]
 
 if t.TYPE_CHECKING:
-    from sqlalchemy.engine import Engine
+    from singer_sdk.connectors.sql import FullyQualifiedName
+    from singer_sdk.helpers._typing import DatetimeErrorTreatmentEnum
+    from singer_sdk.sinks.core import BaseJSONSchemaValidator
+    from singer_sdk.target_base import Target
+    from sqlalchemy.engine import Connection, Engine
     from sqlalchemy.sql import Executable  # type: ignore[attr-defined]
 
+    from target_db2.memory import MemoryAccountant
+
+from target_db2.arrow import arrow_installed, parse_datelike
+from target_db2.batch_files import read_batch_file
+from target_db2.batching import AdaptiveBatchSizer, PhaseTimer
+from target_db2.buffers import (
+    ColumnarRecordBuffer,
+    ConvertedColumnarRecordBuffer,
+    RecordBuffer,
+    SpillRecordBuffer,
+    StreamedRecordBuffer,
+    chunked,
+)
+from target_db2.delimited import DEL_MODIFIERS, write_delimited
 from target_db2.ibm_db_sa import VARCHAR
+from target_db2.keys import KeyFilter
+from target_db2.memory import RecordSizeSampler
+from target_db2.serializers import (
+    get_json_deserializer,
+    get_json_serializer,
+    get_record_serializer,
+    schema_fingerprint,
+)
+from target_db2.validation import SampledValidator, get_compiled_validator
 
 MAX_VARCHAR_SIZE = 10000
 MAX_PK_STRING_SIZE = 1022
 MAX_DECIMAL_PRECISION = 31
+MAX_IDENTIFIER_SIZE = 128
+# messages of rejected rows logged per LOAD or IMPORT
+MAX_LOAD_MESSAGES = 100
+# Db2 utility of each `load_engine` loading files
+FILE_LOAD_ENGINES = {"load_from_file": "LOAD", "import_from_file": "IMPORT"}
+INSERT_CHUNK_ROWS = 10000
+# column of the load table holding records as JSON, see `stage_format`
+RECORD_COLUMN = "_sdc_record"
+# largest logged CLOB
+MAX_RECORD_SIZE = 1024 * 1024 * 1024
+# missing properties of staged JSON records are NULL, other errors are raised
+JSON_COLUMN_BEHAVIOR = "NULL ON EMPTY ERROR ON ERROR"
+# column holding a hash of the compared columns, see `Db2Sink.row_hash`
+ROW_HASH_COLUMN = "_sdc_row_hash"
+ROW_HASH_SIZE = 16
+# random characters ending the names of load & shadow tables
+TABLE_NAME_SUFFIX_SIZE = 5
+# share of staged keys found in the target above which the `auto` upsert
+# strategy considers a batch mostly updates
+MOSTLY_UPDATES_RATIO = 0.5
+# smallest number of keys a known key filter is sized for
+KNOWN_KEYS_MIN_CAPACITY = 100000
+
+_S = t.TypeVar("_S")
 
 sa.dialects.registry.register("ibm_db_sa", "target_db2.ibm_db_sa", "dialect")
 
@@ -38,7 +100,11 @@ class JSONVARCHAR(sa.types.TypeDecorator):
     impl = VARCHAR
 
     def process_bind_param(self, value, dialect):  # noqa: ARG002, ANN001, ANN201
-        """Serialize json to string."""
+        """Serialize json to string.
+
+        Sinks insert values serialized by `Db2Sink.serialize_json_columns`
+        with untyped parameters, so they are not serialized again here.
+        """
         return json.dumps(value)
 
     def process_result_value(self, value, dialect):  # noqa: ARG002, ANN001, ANN201
@@ -233,6 +299,9 @@ class DB2Connector(SQLConnector):
     ) -> None:
         """Adapt target table to provided schema if possible.
 
+        Tables are never dropped, `overwrite` loads go to a shadow table which
+        replaces the table, see `Db2Sink.full_table_name`.
+
         Args:
             full_table_name: the target table name.
             schema: the JSON Schema for the table.
@@ -249,16 +318,6 @@ class DB2Connector(SQLConnector):
                 as_temp_table=as_temp_table,
             )
             return
-        if self.config["load_method"] == TargetLoadMethods.OVERWRITE:
-            self.get_table(full_table_name=full_table_name).drop(self._engine)
-            self.create_empty_table(
-                full_table_name=full_table_name,
-                schema=schema,
-                primary_keys=primary_keys,
-                partition_keys=partition_keys,
-                as_temp_table=as_temp_table,
-            )
-            return
 
         for property_name, property_def in schema["properties"].items():
             self.prepare_column(
@@ -267,6 +326,227 @@ class DB2Connector(SQLConnector):
                 self.to_sql_type(property_def, property_name in primary_keys),
             )
 
+    def replace_table(self, full_table_name: str, from_full_table_name: str) -> None:
+        """Replace a table by another table of the same schema.
+
+        The table is dropped & the other table renamed to it in 1 transaction,
+        so readers never see a missing or empty table.
+
+        Args:
+            full_table_name: The table to replace.
+            from_full_table_name: The table replacing it, in the same schema.
+        """
+        _, _, table_name = self.parse_full_table_name(full_table_name)
+        table_exists = self.table_exists(full_table_name)
+        with self._connect() as conn, conn.begin():
+            if table_exists:
+                conn.execute(sa.text(f"DROP TABLE {self.quote(full_table_name)}"))
+            conn.execute(
+                sa.text(
+                    f"RENAME TABLE {self.quote(from_full_table_name)} "
+                    f"TO {self.quote(table_name)}"
+                )
+            )
+        self.logger.info("Replaced %s by %s", full_table_name, from_full_table_name)
+
+    def drop_tables_created_before(
+        self,
+        full_table_name: str | FullyQualifiedName,
+        prefix: str,
+        suffix_size: int,
+    ) -> None:
+        """Drop the tables of a name pattern created before a table.
+
+        Used to drop tables left by failed syncs, whose names end with a
+        random suffix. Tables created since are kept, as they may be in use.
+
+        Args:
+            full_table_name: The table, tables of its schema created before it
+                are dropped.
+            prefix: Prefix of the names of the tables to drop.
+            suffix_size: Number of characters following the prefix.
+        """
+        _, schema_name, table_name = self.parse_full_table_name(full_table_name)
+        escaped_prefix = prefix.replace("!", "!!").replace("_", "!_").replace("%", "!%")
+        query = sa.text(
+            "SELECT t.TABSCHEMA, t.TABNAME FROM SYSCAT.TABLES t "
+            "JOIN SYSCAT.TABLES r ON r.TABSCHEMA = t.TABSCHEMA "
+            "WHERE r.TABSCHEMA = COALESCE(:schema_name, CURRENT SCHEMA) "
+            "AND UPPER(r.TABNAME) = UPPER(:table_name) "
+            "AND UPPER(t.TABNAME) LIKE UPPER(:pattern) ESCAPE '!' "
+            "AND t.TYPE = 'T' AND t.CREATE_TIME < r.CREATE_TIME"
+        ).bindparams(
+            sa.bindparam("schema_name", type_=sa.String),
+        )
+        with self._connect() as conn, conn.begin():
+            stale_tables = conn.execute(
+                query,
+                {
+                    "schema_name": schema_name.upper() if schema_name else None,
+                    "table_name": table_name,
+                    "pattern": escaped_prefix + "_" * suffix_size,
+                },
+            ).all()
+            for tabschema, tabname in stale_tables:
+                conn.execute(
+                    sa.text(f"DROP TABLE {self.quote(f'{tabschema}.{tabname}')}")
+                )
+                self.logger.info("Dropped stale table %s.%s", tabschema, tabname)
+
+    def load_from_cursor(
+        self,
+        full_table_name: str,
+        query: str,
+        columns: t.Sequence[str],
+    ) -> dict[str, int]:
+        """Load the rows of a query to a table with the Db2 LOAD utility.
+
+        Rows are written a page at a time & not logged (NONRECOVERABLE), so
+        the table is not left in backup pending state, and other applications
+        may read its existing rows meanwhile. A rollforward through the load
+        leaves the table inaccessible though. See `run_load_command`.
+
+        Args:
+            full_table_name: The table to load to.
+            query: Query selecting the rows, in the order of `columns`.
+            columns: The columns to load.
+
+        Returns:
+            Row counts reported by LOAD, e.g. `ROWS_LOADED` & `ROWS_REJECTED`.
+        """
+        column_names = ", ".join(self.quote(c) for c in columns)
+        command = (
+            f"LOAD FROM ({query}) OF CURSOR MESSAGES ON SERVER "
+            f"INSERT INTO {self.quote(full_table_name)} ({column_names}) "
+            "NONRECOVERABLE ALLOW READ ACCESS"
+        )
+        return self.run_load_command(full_table_name, command)
+
+    def load_from_file(
+        self,
+        full_table_name: str,
+        path: str,
+        columns: t.Sequence[str],
+        utility: str = "LOAD",
+    ) -> dict[str, int]:
+        """Load the rows of a DEL file on the Db2 server to a table.
+
+        `LOAD` writes pages like `load_from_cursor`. `IMPORT` inserts rows,
+        logged & firing triggers, and the table stays available to others.
+        See `run_load_command`.
+
+        Args:
+            full_table_name: The table to load to.
+            path: Path of the file on the Db2 server. Must not hold spaces.
+            columns: The columns to load, in the order of the file's fields.
+            utility: `LOAD` or `IMPORT`.
+
+        Returns:
+            Row counts reported by the utility, e.g. `ROWS_REJECTED`.
+        """
+        column_names = ", ".join(self.quote(c) for c in columns)
+        command = (
+            f"{utility} FROM {path} OF DEL MODIFIED BY {DEL_MODIFIERS} "
+            f"MESSAGES ON SERVER "
+            f"INSERT INTO {self.quote(full_table_name)} ({column_names})"
+        )
+        if utility == "LOAD":
+            command += " NONRECOVERABLE ALLOW READ ACCESS"
+        return self.run_load_command(full_table_name, command)
+
+    def run_load_command(self, full_table_name: str, command: str) -> dict[str, int]:
+        """Run a LOAD or IMPORT command with ADMIN_CMD, leaving the table usable.
+
+        A failed LOAD is terminated, taking the table out of load pending
+        state. A table left in set integrity pending state, e.g. by check
+        constraints, is then checked. Messages of rejected rows are logged,
+        then removed from the server.
+
+        Args:
+            full_table_name: The table loaded to.
+            command: The LOAD or IMPORT command, with `MESSAGES ON SERVER`.
+
+        Returns:
+            Row counts reported by the utility, e.g. `ROWS_REJECTED`.
+        """
+        is_load = command.startswith("LOAD")
+        try:
+            with self._connect() as conn:
+                row = (
+                    conn.execute(
+                        sa.text("CALL SYSPROC.ADMIN_CMD(:command)"),
+                        {"command": command},
+                    )
+                    .mappings()
+                    .first()
+                )
+        except sa.exc.DBAPIError:
+            if is_load:
+                self.terminate_load(full_table_name)
+            raise
+        result = {str(key).upper(): value for key, value in (row or {}).items()}
+        if is_load and self.table_status(full_table_name) == "C":
+            table_name = self.quote(full_table_name)
+            with self._connect() as conn, conn.begin():
+                conn.execute(
+                    sa.text(f"SET INTEGRITY FOR {table_name} IMMEDIATE CHECKED")
+                )
+            self.logger.info("Checked integrity of %s after LOAD", table_name)
+        self.log_load_messages(result)
+        return {key: value for key, value in result.items() if key.startswith("ROWS_")}
+
+    def log_load_messages(self, result: dict[str, t.Any]) -> None:
+        """Log messages of the rows a utility rejected, then remove them.
+
+        Args:
+            result: Result of ADMIN_CMD, holding queries retrieving & removing
+                its messages.
+        """
+        retrieval_sql = result.get("MSG_RETRIEVAL")
+        removal_sql = result.get("MSG_REMOVAL")
+        with self._connect() as conn, conn.begin():
+            if retrieval_sql and (
+                result.get("ROWS_REJECTED") or result.get("ROWS_DELETED")
+            ):
+                messages = conn.execute(sa.text(retrieval_sql))
+                for sqlcode, message in messages.fetchmany(MAX_LOAD_MESSAGES):
+                    self.logger.warning("%s: %s", sqlcode, message)
+            if removal_sql:
+                conn.execute(sa.text(removal_sql))
+
+    def terminate_load(self, full_table_name: str) -> None:
+        """Terminate a failed LOAD, taking the table out of load pending state."""
+        command = (
+            f"LOAD FROM /dev/null OF DEL TERMINATE INTO {self.quote(full_table_name)}"
+        )
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    sa.text("CALL SYSPROC.ADMIN_CMD(:command)"),
+                    {"command": command},
+                )
+        except sa.exc.DBAPIError:
+            self.logger.exception("Could not terminate the LOAD of %s", full_table_name)
+
+    def table_status(self, full_table_name: str) -> str | None:
+        """Return the status of a table, e.g. `C` when set integrity pending."""
+        _, schema_name, table_name = self.parse_full_table_name(full_table_name)
+        query = sa.text(
+            "SELECT STATUS FROM SYSCAT.TABLES "
+            "WHERE TABSCHEMA = COALESCE(:schema_name, CURRENT SCHEMA) "
+            "AND UPPER(TABNAME) = UPPER(:table_name)"
+        ).bindparams(
+            sa.bindparam("schema_name", type_=sa.String),
+        )
+        with self._connect() as conn:
+            return conn.execute(
+                query,
+                {
+                    "schema_name": schema_name.upper() if schema_name else None,
+                    "table_name": table_name,
+                },
+            ).scalar()
+
     def schema_exists(self, schema_name: str) -> bool:
         """Determine if the target database schema already exists.
 
@@ -435,11 +715,41 @@ class DB2Connector(SQLConnector):
         _ = sa.Table(table_name, meta, *columns)
         meta.create_all(self._engine)
 
-    def execute_queries(self, queries: list[Executable]) -> None:
-        """Execute queries in 1 transaction."""
-        with self._connect() as conn, conn.begin():
-            for stmt in queries:
-                conn.execute(stmt)
+    def create_record_table(self, full_table_name: str, column_name: str) -> None:
+        """Create a table of 1 CLOB column, holding records as JSON documents.
+
+        Args:
+            full_table_name: the table name.
+            column_name: the column name.
+        """
+        _, schema_name, table_name = self.parse_full_table_name(full_table_name)
+        meta = sa.MetaData(schema=schema_name)
+        _ = sa.Table(
+            table_name,
+            meta,
+            sa.Column(column_name, sa.types.CLOB(MAX_RECORD_SIZE)),
+        )
+        meta.create_all(self._engine)
+
+    def execute_queries(
+        self,
+        queries: list[Executable],
+        timer: PhaseTimer | None = None,
+    ) -> None:
+        """Execute queries in 1 transaction.
+
+        Args:
+            queries: Statements to execute.
+            timer: Optional timer, statements are timed as the `merge` phase
+                and the commit as the `commit` phase.
+        """
+        timer = timer or PhaseTimer()
+        with self._connect() as conn, conn.begin() as transaction:
+            with timer.phase("merge"):
+                for stmt in queries:
+                    conn.execute(stmt)
+            with timer.phase("commit"):
+                transaction.commit()
 
 
 class Db2Sink(SQLSink):
@@ -447,14 +757,373 @@ class Db2Sink(SQLSink):
 
     connector_class = DB2Connector
 
-    def __init__(self, *args, **kwargs):  # noqa: ANN002, ANN003, ANN204
+    def __init__(  # noqa: PLR0913
+        self,
+        target: Target,
+        stream_name: str,
+        schema: dict,
+        key_properties: t.Sequence[str] | None,
+        connector: DB2Connector | None = None,
+    ) -> None:
         """Initialize the Sink."""
-        super().__init__(*args, **kwargs)
+        # memo tables of `conform_name` & `conform_schema`, set before the
+        # parent initializer which conforms the table name
+        self._conformed_names: dict[str | None, dict[str, str]] = {}
+        self._conformed_name_sources: dict[str | None, dict[str, str]] = {}
+        self._conformed_schemas: dict[str, dict] = {}
+        # SQL statements built by `cached_statement`
+        self._statements: dict[tuple, t.Any] = {}
+        super().__init__(target, stream_name, schema, key_properties, connector)
+        # shared by all sinks of the target, see `TargetDb2.memory_accountant`
+        self.memory_accountant: MemoryAccountant | None = getattr(
+            target, "memory_accountant", None
+        )
+        # estimates the memory of buffered records, only when it is budgeted
+        self.record_size_sampler: RecordSizeSampler | None = (
+            RecordSizeSampler() if self.memory_accountant else None
+        )
         self.load_table_name = self.generate_load_table_name()
+        # shadow tables of `overwrite` loads, by live table name, mapped to the
+        # last sink loading them, shared by all sinks of the target
+        self.shadow_tables: dict[FullyQualifiedName, Db2Sink] = getattr(
+            target, "shadow_tables", {}
+        )
+        # unique to the sync, and kept by the next sink of the stream
+        previous_sink = self.shadow_tables.get(self.full_live_table_name)
+        self.shadow_table_name: str = (
+            previous_sink.shadow_table_name
+            if previous_sink
+            else self.generate_shadow_table_name()
+        )
+        self._max_batch_age: float | None = self.stream_option("max_batch_age_seconds")
+        self._batch_started_at: float | None = None
+        self._batch_sizer: AdaptiveBatchSizer | None = None
+        self.json_serializer = get_json_serializer(self.config.get("json_serializer"))
+        self.stage_format: str = self.stream_option("stage_format", "columns")
+        self.record_serializer = get_record_serializer(
+            self.config.get("json_serializer")
+        )
+        self.change_detection: str | None = self.stream_option("change_detection")
+        self.sparse_records: bool = self.stream_option("sparse_records", default=False)
+        if self.change_detection == "row_hash" and self.sparse_records:
+            # a partial record does not hash the columns it lacks
+            self.logger.warning(
+                "`row_hash` change detection is not supported with sparse "
+                "records, comparing the columns of '%s' instead.",
+                self.stream_name,
+            )
+            self.change_detection = "columns"
+        self.batch_buffer: str | None = self.stream_option("batch_buffer")
+        if self.sparse_records and self.batch_buffer in {"disk", "columnar", "arrow"}:
+            # columnar buffers fill missing properties with None, and the disk
+            # buffer replaces records with the same key rather than merging
+            self.logger.warning(
+                "The `%s` batch buffer is not supported with sparse records, "
+                "buffering records of '%s' in memory instead.",
+                self.batch_buffer,
+                self.stream_name,
+            )
+            self.batch_buffer = "memory"
+        self.upsert_strategy: str = self.stream_option("upsert_strategy", "merge")
+        self.table_lock: str | None = self.stream_option("table_lock")
+        self.hard_delete: bool = self.config.get("hard_delete", False)
+        # seconds spent waiting for table locks in the current batch
+        self.lock_wait_seconds = 0.0
+        # number of batches loaded with each upsert strategy
+        self.upsert_strategy_counts: Counter[str] = Counter()
+        # keys of the final table, see `known_key_filter`, loaded in `setup`
+        self.known_keys: KeyFilter | None = None
+        # date-like columns parsed once per batch, see `parse_datelike_column`
+        self.datelike_converters: dict[str, t.Callable[[list], list]] = {}
+        if self.batch_buffer == "arrow":
+            if arrow_installed():
+                self.datelike_converters = {
+                    name: partial(self.parse_datelike_column, name)
+                    for name, property_schema in self.schema["properties"].items()
+                    if get_datelike_property_type(property_schema)
+                }
+            else:
+                self.logger.warning(
+                    "pyarrow is not installed, buffering records of '%s' as "
+                    "`columnar` instead of `arrow`.",
+                    self.stream_name,
+                )
+        if self.change_detection == "row_hash":
+            self.schema["properties"][ROW_HASH_COLUMN] = {
+                "type": ["string", "null"],
+                "maxLength": ROW_HASH_SIZE * 2,
+            }
+        if self.stream_option("adaptive_batch_size", default=False):
+            self._batch_sizer = AdaptiveBatchSizer(
+                initial_size=self.stream_option(
+                    "batch_size_rows", self.MAX_SIZE_DEFAULT
+                ),
+                min_size=self.stream_option("min_batch_size_rows", 1000),
+                max_size=self.stream_option("max_batch_size_rows", 100000),
+                target_latency=self.stream_option("target_batch_latency_seconds", 60),
+                logger=self.logger,
+            )
+
+    def stream_option(self, name: str, default: t.Any = None) -> t.Any:  # noqa: ANN401
+        """Return a setting for this stream.
+
+        A value set for this stream in `stream_options` takes precedence over
+        the target-wide setting of the same name.
+
+        Args:
+            name: Setting name.
+            default: Value returned when the setting is not configured.
+
+        Returns:
+            The configured value, or `default`.
+        """
+        stream_options = self.config.get("stream_options") or {}
+        value = (stream_options.get(self.stream_name) or {}).get(name)
+        if value is None:
+            value = self.config.get(name)
+        return default if value is None else value
+
+    @property
+    def batch_size_rows(self) -> int | None:
+        """Get the maximum number of rows in a batch, used by `max_size`.
+
+        Uses `batch_size_rows` from this stream's `stream_options` if set,
+        otherwise the target-wide `batch_size_rows`. With `adaptive_batch_size`
+        enabled, the size is chosen from the throughput of previous batches.
+        """
+        if self._batch_sizer:
+            return self._batch_sizer.batch_size
+        return self.stream_option("batch_size_rows")
+
+    @property
+    def batch_age_exceeded(self) -> bool:
+        """Check if the pending batch is older than `max_batch_age_seconds`."""
+        if not self._max_batch_age or self._batch_started_at is None:
+            return False
+        return time.monotonic() - self._batch_started_at >= self._max_batch_age
+
+    @property
+    def is_full(self) -> bool:
+        """Check against size and age limits.
+
+        Returns:
+            True if the sink needs to be drained.
+        """
+        return super().is_full or self.batch_age_exceeded
+
+    def get_validator(self) -> BaseJSONSchemaValidator | None:
+        """Get the record validator, as configured by `validation_mode`.
+
+        `full` validates every record, `sampled` 1 in `validation_sample_rate`
+        records, and `off` none. Schemas are compiled once, and the compiled
+        validator shared by all sinks of the same schema.
+        """
+        mode = self.config.get("validation_mode", "full")
+        if not self.validate_schema or mode == "off":
+            return None
+        every = self.config.get("validation_sample_rate", 100)
+        return SampledValidator(
+            get_compiled_validator(
+                self.schema,
+                validate_formats=self.validate_field_string_format,
+            ),
+            every=every if mode == "sampled" else 1,
+        )
+
+    def start_batch(self, context: dict) -> None:
+        """Start a new batch, recording when it started."""
+        super().start_batch(context)
+        self._batch_started_at = time.monotonic()
+        context["records"] = self.create_record_buffer()
+
+    def create_record_buffer(self) -> RecordBuffer:
+        """Create the buffer holding the records of a new batch.
+
+        With `batch_buffer` set to `disk`, records are spilled to a temporary
+        file in `spill_directory` instead of being held in memory. With
+        `columnar`, records are held as one list of values per column. With
+        `arrow`, date-like columns are also parsed once the batch is read.
+        Sparse records are always held in memory, merging records with the
+        same key.
+        """
+        if self.batch_buffer == "disk":
+            return SpillRecordBuffer(
+                key_properties=self.key_properties,
+                directory=self.config.get("spill_directory"),
+            )
+        if self.datelike_converters:
+            return ConvertedColumnarRecordBuffer(
+                columns=list(self.schema["properties"]),
+                key_properties=self.key_properties,
+                converters=self.datelike_converters,
+                size_estimator=self.record_size_sampler,
+            )
+        if self.batch_buffer in {"columnar", "arrow"}:
+            return ColumnarRecordBuffer(
+                columns=list(self.schema["properties"]),
+                key_properties=self.key_properties,
+                size_estimator=self.record_size_sampler,
+            )
+        return RecordBuffer(
+            key_properties=self.key_properties,
+            merge_duplicates=self.sparse_records,
+            size_estimator=self.record_size_sampler,
+        )
+
+    def _parse_timestamps_in_record(
+        self,
+        record: dict,
+        schema: dict,
+        treatment: DatetimeErrorTreatmentEnum,
+    ) -> None:
+        """Parse the date-like strings of a record, unless parsed per batch.
+
+        With `batch_buffer` set to `arrow`, strings are buffered as is, then
+        parsed by `parse_datelike_column` when the batch is read.
+        """
+        if not self.datelike_converters:
+            super()._parse_timestamps_in_record(record, schema, treatment)
+
+    def parse_datelike_column(self, name: str, values: list[t.Any]) -> list[t.Any]:
+        """Parse the date-like strings of a column of a batch.
+
+        Date-times & dates are parsed at once by Arrow, date-times to naive
+        values at the wall-clock time of their zone offset, as written to Db2
+        when parsed like the SDK. Times, strings of other formats, and columns
+        Arrow fails to parse are parsed one value at a time like the SDK.
+
+        Args:
+            name: The column name.
+            values: The column values, strings unless already parsed.
+
+        Returns:
+            The parsed values.
+        """
+        datelike_type = get_datelike_property_type(self.schema["properties"][name])
+        if datelike_type and datelike_type != "time":
+            try:
+                parsed, unparsed = parse_datelike(values, datelike_type)
+            except (ValueError, TypeError) as e:
+                self.logger.debug("Parsing '%s' value by value: %s", name, e)
+            else:
+                for i in unparsed:
+                    parsed[i] = self._parse_datelike_value(name, values[i])
+                return parsed
+        return [self._parse_datelike_value(name, value) for value in values]
+
+    def _parse_datelike_value(self, name: str, value: t.Any) -> t.Any:  # noqa: ANN401
+        """Parse a date-like string of a column like the SDK."""
+        record = {name: value}
+        if isinstance(value, str):
+            super()._parse_timestamps_in_record(
+                record, self.schema, self.datetime_error_treatment
+            )
+        return record[name]
+
+    def process_record(self, record: dict, context: dict) -> None:
+        """Buffer the record, accounting for the memory it uses.
+
+        A record replaces the buffered record with the same key, if any, so
+        only the last record of each key is kept.
+        """
+        if self.change_detection == "row_hash":
+            record[ROW_HASH_COLUMN] = self.row_hash(record)
+        buffer: RecordBuffer = context["records"]
+        nbytes = buffer.nbytes
+        if buffer.append(record):
+            self.tally_duplicate_merged()
+        if self.memory_accountant:
+            self.memory_accountant.add(self, buffer.nbytes - nbytes)
+
+    def mark_drained(self) -> None:
+        """Reset batch tracking after a drain."""
+        super().mark_drained()
+        self._batch_started_at = None
+        self._batch_dupe_records_merged = 0
+        if self.memory_accountant:
+            self.memory_accountant.release(self)
+
+    def clean_up(self) -> None:
+        """Report the peak memory used by buffered records & validation counts."""
+        if self.memory_accountant:
+            self.logger.info(
+                "Peak memory of buffered records: %d bytes",
+                self.memory_accountant.peak_bytes(self),
+            )
+        if self.upsert_strategy_counts:
+            self.logger.info(
+                "Batches upserted per strategy: %s",
+                dict(self.upsert_strategy_counts),
+            )
+        if self.overwrite and self.shadow_tables.get(self.full_live_table_name) is self:
+            self.connector.replace_table(
+                self.full_live_table_name, self.full_table_name
+            )
+            del self.shadow_tables[self.full_live_table_name]
+            self.connector.drop_tables_created_before(
+                self.full_live_table_name,
+                prefix=self.shadow_table_prefix,
+                suffix_size=TABLE_NAME_SUFFIX_SIZE,
+            )
+        if isinstance(self._validator, SampledValidator):
+            self.logger.info(
+                "Validated %d of %d records",
+                self._validator.records_validated,
+                self._validator.records_seen,
+            )
+        super().clean_up()
+
+    @property
+    def overwrite(self) -> bool:
+        """Check if the table is replaced by the stream's records."""
+        return self.config.get("load_method") == TargetLoadMethods.OVERWRITE
+
+    @property
+    def full_table_name(self) -> FullyQualifiedName:
+        """Return the fully qualified name of the table records are loaded to.
+
+        With the `overwrite` load method, records are loaded to a shadow table,
+        which replaces the live table when the stream completes, in
+        `clean_up`. Otherwise, records are loaded to the live table.
+        """
+        if self.overwrite:
+            return self.full_shadow_table_name
+        return self.full_live_table_name
+
+    @property
+    def full_live_table_name(self) -> FullyQualifiedName:
+        """Return the fully qualified name of the table of the stream."""
+        return super().full_table_name
+
+    @property
+    def full_shadow_table_name(self) -> FullyQualifiedName:
+        """Return the fully qualified name of the shadow table, see `overwrite`."""
+        return self.connector.get_fully_qualified_name(
+            table_name=self.shadow_table_name,
+            schema_name=self.schema_name,
+            db_name=self.database_name,
+        )
+
+    @property
+    def shadow_table_prefix(self) -> str:
+        """Return the prefix of the names of the shadow tables of the stream."""
+        return "shadow_" + self.table_name + "_"
+
+    def generate_shadow_table_name(self) -> str:
+        """Generate a name for the shadow table, unique to the sync.
+
+        Overlapping syncs of a stream so never load the same shadow table.
+        """
+        random_chars = "".join(
+            [choice(ascii_lowercase) for _ in range(TABLE_NAME_SUFFIX_SIZE)]  # noqa: S311
+        )
+        return self.shadow_table_prefix + random_chars
 
     def generate_load_table_name(self) -> str:
         """Generate a name for the loading table."""
-        random_chars = "".join([choice(ascii_lowercase) for _ in range(5)])  # noqa: S311
+        random_chars = "".join(
+            [choice(ascii_lowercase) for _ in range(TABLE_NAME_SUFFIX_SIZE)]  # noqa: S311
+        )
         return "load_" + self.table_name + "_" + random_chars
 
     @property
@@ -470,37 +1139,82 @@ class Db2Sink(SQLSink):
             db_name=self.database_name,
         )
 
-    @property
+    @cached_property
     def object_and_array_columns(self) -> list[str]:
         """List of object and array columns.
 
         These columns are serialized to JSON before writing to the database.
+        Computed once, as a sink's schema does not change.
         """
-        object_cols = [
+        return [
             name
             for name, x in self.schema["properties"].items()
-            if x["type"] == "object" or "object" in x["type"]
+            if _jsonschema_type_check(x, ("object",))
+            or _jsonschema_type_check(x, ("array",))
+        ]
+
+    @cached_property
+    def compared_columns(self) -> list[str]:
+        """Columns compared to detect changed rows, see `change_detection`.
+
+        Key properties are matched rather than compared, and metadata columns
+        differ on every sync, except the soft delete column.
+        """
+        return [
+            name
+            for name in self.schema["properties"]
+            if name not in self.key_properties
+            and name != ROW_HASH_COLUMN
+            and (not name.startswith("_sdc_") or name == self.soft_delete_column_name)
         ]
-        array_cols = [
+
+    @cached_property
+    def compared_datetime_columns(self) -> list[str]:
+        """Compared columns of date-times, see `row_hash`."""
+        return [
             name
-            for name, x in self.schema["properties"].items()
-            if x["type"] == "array" or "array" in x["type"]
+            for name in self.compared_columns
+            if get_datelike_property_type(self.schema["properties"][name])
+            == "date-time"
         ]
-        return object_cols + array_cols
 
-    @staticmethod
-    def deduplicate_records(
-        records: list[dict[str, t.Any]], key_properties: list[str]
-    ) -> list[dict[str, t.Any]]:
-        """Keep the last unique record for each key."""
-        seen = set()
-        deduplicated_records = []
-        for rec in reversed(records):
-            key = tuple([rec[k] for k in key_properties])
-            if key not in seen:
-                deduplicated_records.append(rec)
-            seen.add(key)
-        return list(reversed(deduplicated_records))
+    def row_hash(self, record: dict[str, t.Any]) -> str:
+        """Hash the values of the compared columns of a record.
+
+        Date-times are hashed at the wall-clock time written to Db2, whether
+        they were parsed as the record was read, with their zone offset, or
+        are still strings, e.g. with the `arrow` batch buffer, so a row's hash
+        does not depend on the buffer.
+        """
+        compared = {
+            name: record[name] for name in self.compared_columns if name in record
+        }
+        for name in self.compared_datetime_columns:
+            value = compared.get(name)
+            if isinstance(value, str):
+                value = self._parse_datelike_value(name, value)
+            if isinstance(value, datetime.datetime):
+                compared[name] = value.replace(tzinfo=None).isoformat()
+        values = json.dumps(compared, default=str)
+        return hashlib.blake2b(
+            values.encode(),
+            digest_size=ROW_HASH_SIZE,
+        ).hexdigest()
+
+    def serialize_json_columns(
+        self, records: t.Iterable[dict[str, t.Any]]
+    ) -> t.Iterator[dict[str, t.Any]]:
+        """Serialize object and array values to JSON strings.
+
+        Each record is serialized in a single pass over its JSON columns.
+        """
+        object_and_array_columns = self.object_and_array_columns
+        serialize = self.json_serializer
+        for rec in records:
+            for c in object_and_array_columns:
+                if c in rec:
+                    rec[c] = serialize(rec[c])
+            yield rec
 
     def process_batch(self, context: dict) -> None:
         """Process a batch with the given batch context.
@@ -511,59 +1225,1139 @@ class Db2Sink(SQLSink):
         Data is inserted into a loading table, and the final table is
         updated via an merge upsert statement. Then the loading table is dropped.
 
-        If duplicates are present, the last record is kept.
+        Duplicates are dropped as records are buffered, keeping the last record.
+
+        Records are streamed from the batch buffer, which may be on disk, to
+        the database in chunks, so they are never all materialized at once.
+
+        Time spent staging, merging & committing is measured, and used to size
+        the next batch when `adaptive_batch_size` is enabled.
 
         Args:
             context: Stream partition or context dictionary.
         """
-        if self.key_properties:
-            records = self.deduplicate_records(context["records"], self.key_properties)
+        buffer = context["records"]
+        if not isinstance(buffer, RecordBuffer):
+            # records passed as a list, as by the SDK
+            buffer = RecordBuffer(
+                key_properties=self.key_properties,
+                merge_duplicates=self.sparse_records,
+            )
+            for rec in context["records"]:
+                if self.change_detection == "row_hash":
+                    rec[ROW_HASH_COLUMN] = self.row_hash(rec)
+                buffer.append(rec)
+        try:
+            self._load_batch(buffer)
+        finally:
+            buffer.close()
 
-        else:
-            records = context["records"]
+    def process_batch_files(
+        self,
+        encoding: BaseBatchFileEncoding,
+        files: t.Sequence[str],
+    ) -> None:
+        """Load the records of the files of a BATCH message.
 
-        for c in self.object_and_array_columns:
-            for rec in records:
-                if c in rec:
-                    rec[c] = (
-                        json.dumps(rec[c])
-                        if isinstance(rec[c], (list, dict))
-                        else rec[c]
+        Files are read from the `batch_config` storage, or the file system of
+        their URL, and decompressed as they are read, see `load_records`.
+
+        Args:
+            encoding: The batch file encoding.
+            files: The batch files to process.
+        """
+        deserialize = get_json_deserializer(self.config.get("json_deserializer"))
+        for path in files:
+            head, tail = StorageTarget.split_url(path)
+            storage = (
+                self.batch_config.storage
+                if self.batch_config
+                else StorageTarget.from_url(head)
+            )
+            with storage.fs(create=False) as batch_fs, batch_fs.open(
+                tail, mode="rb"
+            ) as file:
+                records = read_batch_file(file, encoding, deserialize)
+                if self.change_detection == "row_hash":
+                    records = (
+                        {**rec, ROW_HASH_COLUMN: self.row_hash(rec)} for rec in records
                     )
-        self.connector.prepare_table(
-            self.full_table_name,
-            schema=self.schema,
-            primary_keys=self.key_properties,
-            as_temp_table=False,
+                self.load_records(records)
+            self.logger.info("Loaded batch file %s", path)
+
+    def load_records(self, records: t.Iterable[dict[str, t.Any]]) -> None:
+        """Load records read from a file rather than RECORD messages.
+
+        Records of streams without key properties are streamed to the table,
+        or to the file of the `load_engine`, in 1 batch, so they are never
+        all held in memory. Records of other streams are buffered & upserted
+        in batches of `batch_size_rows`, deduplicated as usual. The records
+        of each batch are counted as written once it is loaded.
+
+        Args:
+            records: The records, read once.
+        """
+        buffers: t.Iterable[RecordBuffer] = (
+            self.split_buffer(records, self.max_size)
+            if self.key_properties
+            else [StreamedRecordBuffer(records)]
         )
-        if not self.key_properties:
-            self.bulk_insert_records(
-                full_table_name=self.full_table_name,
+        for buffer in buffers:
+            with self.batch_processing_timer:
+                try:
+                    self._load_batch(buffer)
+                    self.tally_record_written(len(buffer))
+                    self.record_counter_metric.increment(len(buffer))
+                finally:
+                    buffer.close()
+
+    def _load_batch(self, buffer: RecordBuffer) -> None:
+        """Load the records of the buffer to the final table.
+
+        With `sparse_records`, records are merged in groups of records having
+        the same properties, each group updating only its own columns.
+        Records of a columnar buffer always have all properties.
+        """
+        timer = PhaseTimer()
+        self.lock_wait_seconds = 0.0
+        with timer.phase("stage"):
+            self.connector.prepare_table(
+                self.full_table_name,
                 schema=self.schema,
-                records=records,
+                primary_keys=self.key_properties,
+                as_temp_table=False,
             )
+        if not self.key_properties:
+            self.insert_records(buffer, timer)
+        elif self.known_keys is None:
+            strategies = self._upsert_batch(buffer, timer)
+            self.batch_processing_timer.tags["upsert_strategy"] = strategies
         else:
+            strategies = []
+            new_records, possible_matches, keys = self.split_new_keys(
+                buffer, self.known_keys
+            )
+            try:
+                if len(new_records):
+                    self.insert_records(new_records, timer)
+                    strategies.append("insert_new_keys")
+                    self.upsert_strategy_counts["insert_new_keys"] += 1
+                if len(possible_matches):
+                    strategies.extend(self._upsert_batch(possible_matches, timer))
+            finally:
+                new_records.close()
+                possible_matches.close()
+            for key in keys:
+                self.known_keys.add(key)
+            if self.known_keys.saturated:
+                self.known_keys = self.load_known_keys()
+            self.batch_processing_timer.tags["upsert_strategy"] = strategies
+        if self.table_lock:
+            self.batch_processing_timer.tags["lock_wait_seconds"] = round(
+                self.lock_wait_seconds, 3
+            )
+        if self._batch_sizer:
+            self._batch_sizer.record_batch(len(buffer), timer)
+
+    def insert_records(self, buffer: RecordBuffer, timer: PhaseTimer) -> None:
+        """Insert records to the final table, with the `load_engine`.
+
+        `load_from_cursor` stages them in the load table, then loads them to
+        the final table with the LOAD utility, timed as the `load` phase.
+        Other engines write them to the final table, see `stage_records`.
+        Records rejected by LOAD, e.g. of invalid values, are logged, see
+        `check_load_counts`.
+        """
+        if self.stream_option("load_engine", "insert") != "load_from_cursor":
+            with timer.phase("stage"):
+                self.stage_records(str(self.full_table_name), buffer)
+            return
+        with timer.phase("stage"):
             self.connector.create_empty_table(
                 self.full_load_table_name,
                 schema=self.schema,
                 primary_keys=self.key_properties,
                 as_temp_table=False,
             )
-            self.bulk_insert_records(
-                full_table_name=self.full_load_table_name,
-                schema=self.schema,
-                records=records,
+        try:
+            with timer.phase("stage"):
+                self.stage_records(self.full_load_table_name, buffer)
+            columns = list(self.schema["properties"])
+            column_names = ", ".join(self.connector.quote(c) for c in columns)
+            select_sql = (
+                f"SELECT {column_names} "
+                f"FROM {self.connector.quote(self.full_load_table_name)}"
             )
-            merge_sql = self.merge_upsert_from_table(
-                from_table_name=self.connector.quote(self.full_load_table_name),
-                target_table_name=self.connector.quote(self.full_table_name),
-                join_keys=self.key_properties,
+            with timer.phase("load"):
+                counts = self.connector.load_from_cursor(
+                    self.full_table_name, select_sql, columns
+                )
+        finally:
+            self.connector.execute_queries(
+                [self.generate_drop_table_statement(self.full_load_table_name)]
             )
-            drop_sql = self.generate_drop_table_statement(self.full_load_table_name)
-            self.connector.execute_queries([merge_sql, drop_sql])
+        self.check_load_counts(
+            self.full_table_name, counts, len(buffer), committed=True
+        )
+
+    def check_load_counts(  # noqa: PLR0913
+        self,
+        full_table_name: str | FullyQualifiedName,
+        counts: dict[str, int],
+        records: int,
+        detail: str = "",
+        *,
+        committed: bool = False,
+    ) -> None:
+        """Log the row counts of a LOAD or IMPORT, and the rows rejected.
+
+        Rows rejected from a load to the final table are logged as an error
+        rather than raised, since the utility committed the other rows, which
+        would be loaded again when the stream is resumed. Rows rejected from
+        a load to the load table of upserts are raised, as none were upserted.
+
+        Args:
+            full_table_name: The table loaded to.
+            counts: Row counts reported by the utility.
+            records: Number of records loaded.
+            detail: Appended to the error message.
+            committed: Whether the rows loaded were committed to the final
+                table.
+
+        Raises:
+            RuntimeError: If rows were rejected, or deleted as duplicates, and
+                not `committed`.
+        """
+        self.logger.info("Loaded to '%s': %s", full_table_name, counts)
+        rejected_rows = counts.get("ROWS_REJECTED", 0) + counts.get("ROWS_DELETED", 0)
+        if rejected_rows:
+            msg = (
+                f"Rejected {rejected_rows} of {records} records of "
+                f"'{self.stream_name}' loaded to {full_table_name}{detail}"
+            )
+            if committed:
+                self.logger.error("%s, the other records were loaded.", msg)
+                return
+            raise RuntimeError(msg)
+
+    def _upsert_batch(self, buffer: RecordBuffer, timer: PhaseTimer) -> list[str]:
+        """Upsert the records of a batch, in chunks of `upsert_chunk_rows`.
+
+        Each chunk is staged, upserted & committed on its own, so the log
+        space & locks held by a transaction are bounded by the chunk size
+        rather than the batch size. Progress is logged after every chunk.
+
+        Returns:
+            The upsert strategy used for each chunk & group of records.
+        """
+        chunk_rows = self.stream_option("upsert_chunk_rows")
+        if not chunk_rows or len(buffer) <= chunk_rows:
+            return self._upsert_groups(buffer, timer)
+        chunk_count = math.ceil(len(buffer) / chunk_rows)
+        strategies = []
+        upserted_rows = 0
+        for i, chunk in enumerate(self.split_buffer(buffer, chunk_rows), start=1):
+            try:
+                strategies.extend(self._upsert_groups(chunk, timer))
+                upserted_rows += len(chunk)
+            finally:
+                chunk.close()
+            self.logger.info(
+                "Upserted chunk %d of %d to '%s', %d of %d records.",
+                i,
+                chunk_count,
+                self.full_table_name,
+                upserted_rows,
+                len(buffer),
+            )
+        return strategies
+
+    def split_buffer(
+        self,
+        buffer: t.Iterable[dict[str, t.Any]],
+        chunk_rows: int,
+    ) -> t.Iterator[RecordBuffer]:
+        """Split records, e.g. of a buffer, into buffers of `chunk_rows` records.
+
+        Chunks are filled as they are consumed, so only one is held at a time.
+
+        Yields:
+            A buffer of the next `chunk_rows` records, in buffer order.
+        """
+        for records in chunked(buffer, chunk_rows):
+            chunk = self.create_record_buffer()
+            for record in records:
+                chunk.append(record)
+            yield chunk
+
+    def _upsert_groups(self, buffer: RecordBuffer, timer: PhaseTimer) -> list[str]:
+        """Upsert records, in groups for sparse records.
+
+        Returns:
+            The upsert strategy used for each group of records.
+        """
+        if not self.sparse_records:
+            return [self._upsert_records(buffer, self.schema, timer)]
+        strategies = []
+        for schema, group in self.group_by_properties(buffer):
+            try:
+                strategies.append(self._upsert_records(group, schema, timer))
+            finally:
+                group.close()
+        return strategies
+
+    def setup(self) -> None:
+        """Set up the sink, loading the known key filter if enabled.
+
+        With the `overwrite` load method, the shadow table is created once per
+        sync, and kept when the stream's schema changes. Shadow tables left by
+        failed syncs are dropped once the shadow table replaced the table.
+        """
+        if self.overwrite:
+            self.shadow_tables[self.full_live_table_name] = self
+        super().setup()
+        if not self.key_properties or not self.stream_option(
+            "known_key_filter", default=False
+        ):
+            return
+        properties = self.schema["properties"]
+        if all(
+            key in properties
+            and (
+                _jsonschema_type_check(properties[key], ("integer",))
+                or (
+                    _jsonschema_type_check(properties[key], ("string",))
+                    and not get_datelike_property_type(properties[key])
+                )
+            )
+            for key in self.key_properties
+        ):
+            self.known_keys = self.load_known_keys()
+        else:
+            self.logger.warning(
+                "Known key filter disabled for '%s': only integer & string key "
+                "properties are supported.",
+                self.stream_name,
+            )
+
+    def load_known_keys(self) -> KeyFilter:
+        """Load the keys of the final table in a filter.
+
+        The filter is sized for twice the number of rows of the table, so it
+        is reloaded once the table doubled.
+        """
+        table_name = self.connector.quote(self.full_table_name)
+        key_columns = ", ".join(self.connector.quote(k) for k in self.key_properties)
+        with self.connector._connect() as conn:  # noqa: SLF001
+            count = conn.execute(sa.text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            known_keys = KeyFilter(
+                capacity=max(2 * (count or 0), KNOWN_KEYS_MIN_CAPACITY)
+            )
+            rows = conn.execution_options(yield_per=INSERT_CHUNK_ROWS).execute(
+                sa.text(f"SELECT {key_columns} FROM {table_name}")
+            )
+            for row in rows:
+                known_keys.add(tuple(row))
+        self.logger.info(
+            "Loaded %d keys of '%s' in the known key filter.",
+            known_keys.count,
+            self.full_table_name,
+        )
+        return known_keys
+
+    def split_new_keys(
+        self,
+        buffer: RecordBuffer,
+        known_keys: KeyFilter,
+    ) -> tuple[RecordBuffer, RecordBuffer, list[tuple]]:
+        """Split records by whether their key is in `known_keys`.
+
+        With `hard_delete`, deleted records of new keys are dropped, as there
+        is no row to delete.
+
+        Returns:
+            New buffers of the records whose key is definitely new and of those
+            whose key possibly exists in the final table, and the keys of all
+            records.
+        """
+        new_records = self.create_record_buffer()
+        possible_matches = self.create_record_buffer()
+        keys = []
+        for record in buffer:
+            key = tuple([record[k] for k in self.key_properties])
+            if key in known_keys:
+                possible_matches.append(record)
+            elif self.hard_delete and record.get(self.soft_delete_column_name):
+                continue
+            else:
+                new_records.append(record)
+            keys.append(key)
+        return new_records, possible_matches, keys
+
+    def _upsert_records(
+        self,
+        buffer: RecordBuffer,
+        schema: dict,
+        timer: PhaseTimer,
+    ) -> str:
+        """Stage records in the load table, then upsert them to the final table.
+
+        Only the properties of `schema` are upserted. With `stage_format` set
+        to `json`, records are staged whole, see `stage_json_records`. The
+        final table is locked per `table_lock`, then the upsert strategy is
+        chosen & run in the same transaction.
+
+        Returns:
+            The upsert strategy used, see `choose_upsert_strategy`.
+        """
+        with timer.phase("stage"):
+            if self.stage_format == "json":
+                self.stage_json_records(self.full_load_table_name, buffer)
+            else:
+                self.connector.create_empty_table(
+                    self.full_load_table_name,
+                    schema=schema,
+                    primary_keys=self.key_properties,
+                    as_temp_table=False,
+                )
+                self.stage_records(self.full_load_table_name, buffer, schema)
+        columns = list(schema["properties"])
+        drop_sql = self.cached_statement(
+            ("drop", self.full_load_table_name),
+            lambda: self.generate_drop_table_statement(self.full_load_table_name),
+        )
+        with self.connector._connect() as conn, conn.begin() as transaction:  # noqa: SLF001
+            self.lock_table(conn, self.full_table_name)
+            strategy = self.choose_upsert_strategy(len(buffer), columns, timer, conn)
+            upsert_sql = self.cached_statement(
+                (
+                    "upsert",
+                    strategy,
+                    self.full_table_name,
+                    self.full_load_table_name,
+                    tuple(self.key_properties),
+                    tuple(columns),
+                ),
+                lambda: self.generate_upsert_statements(strategy, columns),
+            )
+            with timer.phase("merge"):
+                for stmt in [*upsert_sql, drop_sql]:
+                    conn.execute(stmt)
+            with timer.phase("commit"):
+                transaction.commit()
+        self.upsert_strategy_counts[strategy] += 1
+        return strategy
+
+    def choose_upsert_strategy(
+        self,
+        staged_rows: int,
+        columns: t.Sequence[str],
+        timer: PhaseTimer,
+        conn: Connection,
+    ) -> str:
+        """Choose how staged records are upserted to the final table.
+
+        `upsert_strategy` is one of:
+        - `merge`: a single MERGE statement.
+        - `delete_insert`: delete the target rows of staged keys, then insert
+          all staged rows. Cheap for updates of column-organized tables.
+        - `update_insert`: update the target rows of staged keys, then insert
+          the rows of new keys. Cheap when most keys are new.
+        - `auto`: count the staged keys already in the target with 1 join,
+          then pick `insert` if none is & the table is locked per
+          `table_lock`, `update_insert` if less than
+          `MOSTLY_UPDATES_RATIO` are, else `delete_insert` for
+          column-organized tables and `merge` for others.
+
+        Rows are only deleted & reinserted when records have all properties,
+        otherwise `update_insert` is used instead of `delete_insert`. Keys are
+        counted in the transaction of the upsert, after the final table is
+        locked, so rows of the staged keys inserted meanwhile by others are
+        not missed. Without `table_lock`, `update_insert` is picked rather
+        than `insert`, which would fail on such rows.
+
+        Args:
+            staged_rows: Number of staged records.
+            columns: Staged columns.
+            timer: Timer of the batch, the key count is timed as `probe`.
+            conn: Connection of the upsert transaction.
+
+        Returns:
+            One of `merge`, `delete_insert`, `update_insert` or `insert`.
+        """
+        has_all_columns = len(columns) == len(self.schema["properties"])
+        strategy = self.upsert_strategy
+        if strategy == "auto":
+            with timer.phase("probe"):
+                matched_rows = self.count_matched_keys(conn)
+            if not matched_rows and self.table_lock:
+                strategy = "insert"
+            elif not matched_rows or matched_rows < staged_rows * MOSTLY_UPDATES_RATIO:
+                strategy = "update_insert"
+            elif self.is_column_organized:
+                strategy = "delete_insert"
+            else:
+                strategy = "merge"
+            self.logger.debug(
+                "%d of %d staged keys found in target, upserting with '%s'.",
+                matched_rows,
+                staged_rows,
+                strategy,
+            )
+        if strategy == "delete_insert" and not has_all_columns:
+            strategy = "update_insert"
+        return strategy
+
+    def count_matched_keys(self, conn: Connection) -> int:
+        """Count the staged records whose key is already in the final table."""
+        target_table_name = self.connector.quote(self.full_table_name)
+        from_table_name = self.staged_source(self.key_properties)
+        count_sql = self.cached_statement(
+            ("count_matched", target_table_name, from_table_name),
+            lambda: sa.text(
+                dedent(f"""
+                    SELECT COUNT(*) FROM {from_table_name} lt
+                    WHERE EXISTS (
+                      SELECT 1 FROM {target_table_name} ft
+                      WHERE {self._join_condition(self.key_properties)}
+                    )
+                    """).strip()
+            ),
+        )
+        return conn.execute(count_sql).scalar() or 0
+
+    @cached_property
+    def is_column_organized(self) -> bool:
+        """Check if the final table is column-organized, e.g. BLU tables.
+
+        The final table is the table records are loaded to, i.e. the shadow
+        table with the `overwrite` load method.
+        """
+        _, schema_name, table_name = self.connector.parse_full_table_name(
+            self.full_table_name
+        )
+        query = sa.text(
+            "SELECT TABLEORG FROM SYSCAT.TABLES "
+            "WHERE TABSCHEMA = COALESCE(:schema_name, CURRENT SCHEMA) "
+            "AND UPPER(TABNAME) = UPPER(:table_name)"
+        ).bindparams(
+            sa.bindparam("schema_name", type_=sa.String),
+        )
+        with self.connector._connect() as conn:  # noqa: SLF001
+            tableorg = conn.execute(
+                query,
+                {
+                    "schema_name": schema_name.upper() if schema_name else None,
+                    "table_name": table_name,
+                },
+            ).scalar()
+        return tableorg == "C"
+
+    def group_by_properties(
+        self,
+        buffer: RecordBuffer,
+    ) -> t.Iterator[tuple[dict, RecordBuffer]]:
+        """Group records by the set of properties they have.
+
+        Yields:
+            The schema of the properties of each group, with the group's
+            records in a new buffer.
+        """
+        properties = self.schema["properties"]
+        # property names in record order -> property names in schema order
+        columns_by_names: dict[tuple[str, ...], tuple[str, ...]] = {}
+        groups: dict[tuple[str, ...], RecordBuffer] = {}
+        for record in buffer:
+            names = tuple(record)
+            columns = columns_by_names.get(names)
+            if columns is None:
+                columns = tuple(name for name in properties if name in record)
+                columns_by_names[names] = columns
+            group = groups.get(columns)
+            if group is None:
+                group = groups[columns] = self.create_record_buffer()
+            group.append(record)
+        for columns, group in groups.items():
+            if len(columns) == len(properties):
+                yield self.schema, group
+            else:
+                properties_subset = {name: properties[name] for name in columns}
+                yield {**self.schema, "properties": properties_subset}, group
+
+    def stage_records(
+        self,
+        full_table_name: str,
+        buffer: RecordBuffer,
+        schema: dict | None = None,
+    ) -> None:
+        """Serialize & insert the buffered records to a table.
+
+        Args:
+            full_table_name: the target table name.
+            buffer: the batch records.
+            schema: the properties to insert, defaults to the sink's schema.
+        """
+        if self.stream_option("load_engine") in FILE_LOAD_ENGINES:
+            self.load_file(full_table_name, buffer, schema or self.schema)
+            return
+        if isinstance(buffer, ColumnarRecordBuffer):
+            for c in self.object_and_array_columns:
+                buffer.map_column(c, self.json_serializer)
+            self.insert_columns(full_table_name, buffer)
+            return
+
+        self.bulk_insert_records(
+            full_table_name=full_table_name,
+            schema=schema or self.schema,
+            records=self.serialize_json_columns(buffer),
+        )
+
+    def stage_json_records(self, full_table_name: str, buffer: RecordBuffer) -> int:
+        """Create a load table of 1 CLOB column, and insert records as JSON.
+
+        Records are neither conformed nor flattened: each is serialized whole
+        & inserted as 1 parameter, in chunks of `INSERT_CHUNK_ROWS`, in 1
+        transaction. Upserts read them through `staged_source`.
+
+        Args:
+            full_table_name: the load table name.
+            buffer: the batch records.
+
+        Returns:
+            The number of records inserted.
+        """
+        self.connector.create_record_table(full_table_name, RECORD_COLUMN)
+        insert_sql = self.cached_statement(
+            ("insert_json", full_table_name),
+            lambda: self.generate_positional_insert_statement(
+                full_table_name, [RECORD_COLUMN]
+            ),
+        )
+        serialize = self.record_serializer
+        rowcount = 0
+        with self.connector._connect() as conn, conn.begin():  # noqa: SLF001
+            for chunk in chunked(buffer, INSERT_CHUNK_ROWS):
+                rows = [(serialize(rec),) for rec in chunk]
+                rowcount += conn.exec_driver_sql(insert_sql, rows).rowcount
+        return rowcount
+
+    def load_file(
+        self,
+        full_table_name: str,
+        buffer: RecordBuffer,
+        schema: dict,
+    ) -> None:
+        """Write records to a DEL file, then load it with the `load_engine`.
+
+        The file is written to `bulk_load_directory`, read by the Db2 server
+        from `bulk_load_server_directory`, and loaded with LOAD for
+        `load_from_file`, or IMPORT for `import_from_file`. It is deleted
+        once loaded, or kept for inspection if rows were rejected.
+
+        Args:
+            full_table_name: the target table name.
+            buffer: the batch records.
+            schema: the properties to load.
+        """
+        directory = self.config.get("bulk_load_directory") or tempfile.gettempdir()
+        server_directory = self.config.get("bulk_load_server_directory") or directory
+        columns = list(self.conform_schema(schema)["properties"])
+        with tempfile.NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            newline="",
+            dir=directory,
+            prefix=f"{self.table_name}_",
+            suffix=".del",
+            delete=False,
+        ) as file:
+            records = map(self.conform_record, self.serialize_json_columns(buffer))
+            write_delimited(file, ([rec.get(c) for c in columns] for rec in records))
+        path = Path(file.name)
+        # files are created private, but are read by the Db2 instance's user
+        path.chmod(0o644)
+        keep_file = False
+        try:
+            counts = self.connector.load_from_file(
+                full_table_name,
+                posixpath.join(server_directory, path.name),
+                columns,
+                utility=FILE_LOAD_ENGINES[self.stream_option("load_engine")],
+            )
+            keep_file = bool(counts.get("ROWS_REJECTED") or counts.get("ROWS_DELETED"))
+            self.check_load_counts(
+                full_table_name,
+                counts,
+                len(buffer),
+                detail=f", from {path}",
+                committed=str(full_table_name) == str(self.full_table_name),
+            )
+        finally:
+            if not keep_file:
+                path.unlink()
+
+    def insert_columns(self, full_table_name: str, buffer: ColumnarRecordBuffer) -> int:
+        """Insert the records of a columnar buffer to an existing table.
+
+        Rows are passed to the driver as tuples of positional parameters, in
+        chunks of `INSERT_CHUNK_ROWS`, in 1 transaction.
+
+        Args:
+            full_table_name: the target table name.
+            buffer: the batch records.
+
+        Returns:
+            The number of records inserted.
+        """
+        property_names = list(self.schema["properties"])
+        insert_sql = self.cached_statement(
+            ("insert_columns", full_table_name),
+            lambda: self.generate_positional_insert_statement(
+                full_table_name, property_names
+            ),
+        )
+
+        self.logger.info("Inserting with SQL: %s", insert_sql)
+        rowcount = 0
+        with self.connector._connect() as conn, conn.begin():  # noqa: SLF001
+            self.lock_table(conn, full_table_name)
+            for chunk in chunked(buffer.rows(property_names), INSERT_CHUNK_ROWS):
+                rowcount += conn.exec_driver_sql(insert_sql, chunk).rowcount
+        return rowcount
+
+    def bulk_insert_records(
+        self,
+        full_table_name: str | FullyQualifiedName,
+        schema: dict,
+        records: t.Iterable[dict[str, t.Any]],
+    ) -> int | None:
+        """Bulk insert records to an existing destination table.
+
+        Records are inserted in chunks of `INSERT_CHUNK_ROWS`, in 1 transaction,
+        so that only one chunk is held in memory at a time.
+
+        Args:
+            full_table_name: the target table name.
+            schema: the JSON schema for the new table.
+            records: the input records.
+
+        Returns:
+            The number of records inserted.
+        """
+        insert_sql = self.cached_statement(
+            ("insert", str(full_table_name), self.fingerprint(schema)),
+            lambda: self._text(
+                self.generate_insert_statement(str(full_table_name), schema)
+            ),
+        )
+        property_names = list(self.conform_schema(schema)["properties"].keys())
+
+        self.logger.info("Inserting with SQL: %s", insert_sql)
+        rowcount = 0
+        with self.connector._connect() as conn, conn.begin():  # noqa: SLF001
+            self.lock_table(conn, full_table_name)
+            for chunk in chunked(records, INSERT_CHUNK_ROWS):
+                conformed_records = [self.conform_record(rec) for rec in chunk]
+                # fill in missing properties with None
+                new_records = [
+                    {name: rec.get(name) for name in property_names}
+                    for rec in conformed_records
+                ]
+                rowcount += conn.execute(insert_sql, new_records).rowcount
+        return rowcount
+
+    def lock_table(
+        self,
+        conn: Connection,
+        full_table_name: str | FullyQualifiedName,
+    ) -> None:
+        """Lock the final table for the transaction of `conn`, per `table_lock`.
+
+        `exclusive` lets Db2 skip row locks, & so lock escalation, but blocks
+        readers other than uncommitted reads until the commit. `share` lets
+        others read but not update the table. Other tables, e.g. load tables,
+        are not locked. Time waiting for the lock adds to `lock_wait_seconds`.
+        """
+        mode = self.table_lock
+        if not mode or full_table_name != self.full_table_name:
+            return
+        lock_sql = self.cached_statement(
+            ("lock", full_table_name, mode),
+            lambda: sa.text(
+                f"LOCK TABLE {self.connector.quote(full_table_name)} "
+                f"IN {mode.upper()} MODE"
+            ),
+        )
+        start = time.perf_counter()
+        conn.execute(lock_sql)
+        self.lock_wait_seconds += time.perf_counter() - start
+
+    def activate_version(self, new_version: int) -> None:
+        """Bump the active version of the target table.
+
+        Rows of older versions are deleted with `hard_delete`, else marked
+        deleted, using an index of the version columns created on the first
+        activation. With `version_cleanup_chunk_rows`, rows are cleaned up in
+        chunks each committed separately, so no lock is held for long.
+
+        Args:
+            new_version: The version number to activate.
+        """
+        if not self.connector.table_exists(self.full_table_name):
+            return
+        columns = [self.version_column_name]
+        if not self.hard_delete:
+            columns.append(self.soft_delete_column_name)
+        for column_name, sql_type in zip(
+            columns, (sa.types.Integer(), sa.types.DateTime())
+        ):
+            if not self.connector.column_exists(self.full_table_name, column_name):
+                self.connector.prepare_column(
+                    self.full_table_name, column_name, sql_type=sql_type
+                )
+        self.create_version_index()
+
+        chunk_rows = self.stream_option("version_cleanup_chunk_rows")
+        cleanup_sql = self.cached_statement(
+            ("version_cleanup", self.full_table_name, self.hard_delete, chunk_rows),
+            lambda: self.generate_version_cleanup_statement(chunk_rows),
+        )
+        params = {"version": new_version, "deleted_at": utc_now()}
+        if self.hard_delete:
+            del params["deleted_at"]
+        cleaned_rows = 0
+        while True:
+            with self.connector._connect() as conn, conn.begin():  # noqa: SLF001
+                rowcount = conn.execute(cleanup_sql, params).rowcount
+            cleaned_rows += max(rowcount, 0)
+            if not chunk_rows or rowcount < chunk_rows:
+                break
+            self.logger.info(
+                "Cleaned up %d rows of versions older than %d in '%s' so far.",
+                cleaned_rows,
+                new_version,
+                self.full_table_name,
+            )
+        self.logger.info(
+            "%s %d rows of versions older than %d in '%s'.",
+            "Deleted" if self.hard_delete else "Marked deleted",
+            cleaned_rows,
+            new_version,
+            self.full_table_name,
+        )
+
+    def create_version_index(self) -> None:
+        """Index the version columns, unless an index starts with them already.
+
+        Unless `hard_delete`, the soft delete column is indexed after the
+        version column, so rows not marked deleted yet are found by the index.
+        """
+        _, schema_name, table_name = self.connector.parse_full_table_name(
+            self.full_table_name
+        )
+        columns = [self.version_column_name]
+        index_suffix = "version"
+        if not self.hard_delete:
+            columns.append(self.soft_delete_column_name)
+            index_suffix = "version_deleted"
+        indexes = sa.inspect(self.connector._engine).get_indexes(  # noqa: SLF001
+            table_name, schema=schema_name
+        )
+        if any(index["column_names"][: len(columns)] == columns for index in indexes):
+            return
+        index_name = self.connector.get_fully_qualified_name(
+            table_name=f"ix_{table_name}_{index_suffix}"[:MAX_IDENTIFIER_SIZE],
+            schema_name=schema_name,
+        )
+        column_list = ", ".join(self.connector.quote(c) for c in columns)
+        self.connector.execute_queries(
+            [
+                sa.text(
+                    f"CREATE INDEX {self.connector.quote(index_name)} "
+                    f"ON {self.connector.quote(self.full_table_name)} "
+                    f"({column_list})"
+                )
+            ]
+        )
+        self.logger.info("Created index %s", index_name)
+
+    def generate_version_cleanup_statement(
+        self,
+        chunk_rows: int | None = None,
+    ) -> Executable:
+        """Delete, or mark deleted, rows of versions older than `:version`.
+
+        With `hard_delete`, given a chunk of 1000 rows, this issues:
+
+            ```
+            DELETE FROM (
+              SELECT * FROM final_tbl
+              WHERE _sdc_table_version < :version
+              FETCH FIRST 1000 ROWS ONLY
+            )
+            ```
+
+        Otherwise, `_sdc_deleted_at` is set to `:deleted_at` for rows not
+        marked deleted yet.
+
+        Args:
+            chunk_rows: Maximum number of rows cleaned up, all by default.
+
+        Returns:
+            The statement, to execute until less than `chunk_rows` rows change.
+        """
+        table_name = self.connector.quote(self.full_table_name)
+        version = self.connector.quote(self.version_column_name)
+        deleted_at = self.connector.quote(self.soft_delete_column_name)
+        condition = f"{version} < :version"
+        if not self.hard_delete:
+            condition += f" AND {deleted_at} IS NULL"
+        if not chunk_rows:
+            if self.hard_delete:
+                return sa.text(f"DELETE FROM {table_name} WHERE {condition}")
+            update_sql = (
+                f"UPDATE {table_name} SET {deleted_at} = :deleted_at "
+                f"WHERE {condition}"
+            )
+        else:
+            chunk = dedent(f"""
+                SELECT * FROM {table_name}
+                  WHERE {condition}
+                  FETCH FIRST {int(chunk_rows)} ROWS ONLY
+                """).strip()
+            if self.hard_delete:
+                return sa.text(f"DELETE FROM (\n{chunk}\n)")
+            update_sql = f"UPDATE (\n{chunk}\n) SET {deleted_at} = :deleted_at"
+        # bound as a timestamp, not left to the driver to guess its type
+        return sa.text(update_sql).bindparams(
+            sa.bindparam("deleted_at", type_=sa.TIMESTAMP)
+        )
+
+    def cached_statement(self, key: tuple, build: t.Callable[[], _S]) -> _S:
+        """Return the statement cached under `key`, building it if missing.
+
+        Statements are cached for the lifetime of the sink, whose schema and
+        key properties do not change, so they are built once per stream
+        schema. Parsed clauses such as `sa.text` are reused as well.
+
+        Args:
+            key: Identifies the statement, e.g. its kind and tables.
+            build: Builds the statement if not cached yet.
+
+        Returns:
+            The statement.
+        """
+        statement = self._statements.get(key)
+        if statement is None:
+            statement = self._statements[key] = build()
+        return statement
+
+    def _join_condition(self, join_keys: t.Sequence[str]) -> str:
+        """Condition matching rows of the final (ft) & load (lt) tables."""
+        return " AND ".join(
+            f"ft.{self.connector.quote(c)} = lt.{self.connector.quote(c)}"
+            for c in join_keys
+        )
+
+    def staged_source(self, columns: t.Sequence[str]) -> str:
+        """Return the source of the staged records, with `columns`.
+
+        Records staged as columns are read from the load table. Records
+        staged as JSON, see `stage_format`, are projected to columns of the
+        final table's types by JSON_TABLE, so Db2 converts the values. Given
+        an integer `col1`, a boolean `col2` & an object `col3`, this returns:
+
+            ```
+            (SELECT jt.col1, CAST(jt.col2 AS BOOLEAN) AS col2, jt.col3
+            FROM load_final_tbl_abc r, JSON_TABLE(
+              r._sdc_record, 'strict $' COLUMNS (
+                col1 INTEGER PATH 'lax $."col1"' NULL ON EMPTY ERROR ON ERROR,
+                col2 VARCHAR(5) PATH 'lax $."col2"' NULL ON EMPTY ERROR ON ERROR,
+                col3 VARCHAR(10000) FORMAT JSON PATH 'lax $."col3"'
+                  NULL ON EMPTY ERROR ON ERROR
+              ) ERROR ON ERROR
+            ) AS jt)
+            ```
+
+        Missing properties are NULL, and values not cast to their column's
+        type raise an error, rather than being NULL as by default.
+        """
+        from_table_name = self.connector.quote(self.full_load_table_name)
+        if self.stage_format != "json":
+            return from_table_name
+        dialect = self.connector._engine.dialect  # noqa: SLF001
+        properties = self.schema["properties"]
+        select_exprs = []
+        column_defs = []
+        for name in columns:
+            column = self.connector.quote(name)
+            member = name.replace("\\", "\\\\").replace('"', '\\"')
+            path = f'lax $."{member}"'.replace("'", "''")
+            if _jsonschema_type_check(properties[name], ("boolean",)):
+                column_defs.append(
+                    f"{column} VARCHAR(5) PATH '{path}' {JSON_COLUMN_BEHAVIOR}"
+                )
+                select_exprs.append(f"CAST(jt.{column} AS BOOLEAN) AS {column}")
+                continue
+            sql_type = self.connector.to_sql_type(
+                dict(properties[name]), is_primary_key=name in self.key_properties
+            ).compile(dialect=dialect)
+            if _jsonschema_type_check(
+                properties[name], ("object",)
+            ) or _jsonschema_type_check(properties[name], ("array",)):
+                sql_type += " FORMAT JSON"
+            column_defs.append(
+                f"{column} {sql_type} PATH '{path}' {JSON_COLUMN_BEHAVIOR}"
+            )
+            select_exprs.append(f"jt.{column}")
+        column_list = ",\n    ".join(column_defs)
+        return (
+            f"(SELECT {', '.join(select_exprs)}\n"
+            f"FROM {from_table_name} r, JSON_TABLE(\n"
+            f"  r.{self.connector.quote(RECORD_COLUMN)}, 'strict $' COLUMNS (\n"
+            f"    {column_list}\n"
+            "  ) ERROR ON ERROR\n"
+            ") AS jt)"
+        )
+
+    def _changed_condition(self, columns: t.Sequence[str]) -> str | None:
+        """Condition on changed rows per `change_detection`, None if disabled."""
+        if not self.change_detection:
+            return None
+        compared_columns = (
+            [ROW_HASH_COLUMN]
+            if self.change_detection == "row_hash"
+            else [c for c in self.compared_columns if c in columns]
+        )
+        changed_exprs = [
+            f"ft.{self.connector.quote(c)} IS DISTINCT FROM "
+            f"lt.{self.connector.quote(c)}"
+            for c in compared_columns
+        ]
+        return " OR ".join(changed_exprs) or None
+
+    def generate_upsert_statements(
+        self,
+        strategy: str,
+        columns: t.Sequence[str],
+    ) -> list[Executable]:
+        """Generate the statements upserting staged records with `strategy`.
+
+        With `hard_delete`, rows of the staged keys having a deletion time are
+        first deleted from the final table with 1 statement, and only staged
+        records without a deletion time are upserted.
+
+        Args:
+            strategy: One of `merge`, `delete_insert`, `update_insert` or
+                `insert`, see `choose_upsert_strategy`.
+            columns: Columns to insert & update.
+
+        Returns:
+            Statements to execute in order, in 1 transaction.
+        """
+        target_table_name = self.connector.quote(self.full_table_name)
+        from_table_name = self.staged_source(columns)
+        statements = []
+        if self.hard_delete and self.soft_delete_column_name in columns:
+            statements.append(self.generate_hard_delete_statement())
+            deleted_at = self.connector.quote(self.soft_delete_column_name)
+            from_table_name = (
+                f"(SELECT * FROM {from_table_name} WHERE {deleted_at} IS NULL)"
+            )
+        if strategy == "merge":
+            statements.append(
+                self.merge_upsert_from_table(
+                    target_table_name=target_table_name,
+                    from_table_name=from_table_name,
+                    join_keys=self.key_properties,
+                    columns=columns,
+                )
+            )
+            return statements
+
+        join_condition = self._join_condition(self.key_properties)
+        final_columns = ", ".join(self.connector.quote(c) for c in columns)
+        load_columns = ", ".join(f"lt.{self.connector.quote(c)}" for c in columns)
+        insert_query = dedent(f"""
+            INSERT INTO {target_table_name} ({final_columns})
+            SELECT {load_columns} FROM {from_table_name} lt
+            """).strip()
+        if strategy == "insert":
+            statements.append(sa.text(insert_query))
+            return statements
+        if strategy == "delete_insert":
+            delete_query = dedent(f"""
+                DELETE FROM {target_table_name} AS ft
+                WHERE EXISTS (SELECT 1 FROM {from_table_name} lt WHERE {join_condition})
+                """).strip()
+            statements.extend([sa.text(delete_query), sa.text(insert_query)])
+            return statements
+
+        # update_insert
+        update_columns = [c for c in columns if c not in self.key_properties]
+        if update_columns:
+            matched_condition = join_condition
+            changed_condition = self._changed_condition(columns)
+            if changed_condition:
+                matched_condition += f" AND ({changed_condition})"
+            set_columns = ", ".join(self.connector.quote(c) for c in update_columns)
+            set_values = ", ".join(
+                f"lt.{self.connector.quote(c)}" for c in update_columns
+            )
+            update_query = dedent(f"""
+                UPDATE {target_table_name} AS ft
+                SET ({set_columns}) = (
+                  SELECT {set_values} FROM {from_table_name} lt
+                  WHERE {join_condition}
+                )
+                WHERE EXISTS (
+                  SELECT 1 FROM {from_table_name} lt WHERE {matched_condition}
+                )
+                """).strip()
+            statements.append(sa.text(update_query))
+        insert_new_query = (
+            f"{insert_query}\n"
+            f"WHERE NOT EXISTS (SELECT 1 FROM {target_table_name} ft "
+            f"WHERE {join_condition})"
+        )
+        statements.append(sa.text(insert_new_query))
+        return statements
+
+    def generate_hard_delete_statement(self) -> Executable:
+        """Delete the rows of the staged keys having a deletion time.
+
+        Given a final table with key `col1`, this issues:
+
+            ```
+            DELETE FROM final_tbl AS ft
+            WHERE EXISTS (
+              SELECT 1 FROM load_final_tbl_abc lt
+              WHERE ft.col1 = lt.col1 AND lt._sdc_deleted_at IS NOT NULL
+            )
+            ```
+        """
+        target_table_name = self.connector.quote(self.full_table_name)
+        from_table_name = self.staged_source(
+            [*self.key_properties, self.soft_delete_column_name]
+        )
+        deleted_at = self.connector.quote(self.soft_delete_column_name)
+        return sa.text(
+            dedent(f"""
+                DELETE FROM {target_table_name} AS ft
+                WHERE EXISTS (
+                  SELECT 1 FROM {from_table_name} lt
+                  WHERE {self._join_condition(self.key_properties)}
+                  AND lt.{deleted_at} IS NOT NULL
+                )
+                """).strip()
+        )
 
     def merge_upsert_from_table(
-        self, target_table_name: str, from_table_name: str, join_keys: list[str]
+        self,
+        target_table_name: str,
+        from_table_name: str,
+        join_keys: t.Sequence[str],
+        columns: t.Sequence[str] | None = None,
     ) -> Executable:
         """Issue a MERGE statement to upsert data to the final table.
 
@@ -583,25 +2377,33 @@ class Db2Sink(SQLSink):
             INSERT (col1, col2, col3)
             VALUES (lt.col1, lt.col2, lt.col3);
             ```
+
+        Only `columns` are inserted & updated when given, e.g. for sparse
+        records, otherwise all properties of the schema.
+
+        With `change_detection` set, unchanged rows are not updated:
+        `columns` updates matched rows only when
+        `ft.col2 IS DISTINCT FROM lt.col2 OR ft.col3 IS DISTINCT FROM lt.col3`,
+        and `row_hash` only when the stored `_sdc_row_hash` differs.
         """
-        join_exprs = [
-            f"ft.{self.connector.quote(c)} = lt.{self.connector.quote(c)}"
-            for c in join_keys
-        ]
-        final_columns = [
-            f"{self.connector.quote(c)}" for c in self.schema["properties"]
-        ]
+        if columns is None:
+            columns = list(self.schema["properties"])
+        final_columns = [f"{self.connector.quote(c)}" for c in columns]
         load_columns = [f"lt.{c}" for c in final_columns]
         update_exprs = [
             f"{self.connector.quote(c)} = lt.{self.connector.quote(c)}"
-            for c in self.schema["properties"]
+            for c in columns
             if c not in join_keys
         ]
+        matched = "WHEN MATCHED"
+        changed_condition = self._changed_condition(columns)
+        if changed_condition:
+            matched += f" AND ({changed_condition})"
         merge_query = dedent(f"""
             MERGE INTO {target_table_name} ft
             USING {from_table_name} lt
-            ON ({' AND '.join(join_exprs)})
-            WHEN MATCHED THEN UPDATE
+            ON ({self._join_condition(join_keys)})
+            {matched} THEN UPDATE
               SET {", ".join(update_exprs)}
             WHEN NOT MATCHED THEN
               INSERT ({', '.join(final_columns)})
@@ -613,12 +2415,14 @@ class Db2Sink(SQLSink):
     def conform_name(
         self,
         name: str,
-        object_type: str | None = None,  # noqa: ARG002
+        object_type: str | None = None,
     ) -> str:
         """Conform a stream property name to one suitable for the target system.
 
         Removes spaces and replaces `.`, `-` & ` ` with `_`
 
+        Names are conformed once per object type, then looked up.
+
         Args:
             name: Property name.
             object_type: One of ``database``, ``schema``, ``table`` or ``column``.
@@ -626,16 +2430,75 @@ class Db2Sink(SQLSink):
 
         Returns:
             The name transformed to snake case.
+
+        Raises:
+            ConformedNameClashException: If another name of the same object type
+                was conformed to the same name.
         """
+        conformed_names = self._conformed_names.setdefault(object_type, {})
+        conformed = conformed_names.get(name)
+        if conformed is not None:
+            return conformed
         # strip non-alphanumeric characters
-        name = re.sub(r"[^a-zA-Z0-9_\-\.\s]", "", name)
+        conformed = re.sub(r"[^a-zA-Z0-9_\-\.\s]", "", name)
         # strip leading/trailing whitespace,
         # replace - . and spaces to _
-        name = (
-            name.lstrip().rstrip().replace(".", "_").replace("-", "_").replace(" ", "_")
+        conformed = (
+            conformed.lstrip()
+            .rstrip()
+            .replace(".", "_")
+            .replace("-", "_")
+            .replace(" ", "_")
         )
         # replace leading digit
-        return replace_leading_digit(name)
+        conformed = replace_leading_digit(conformed)
+
+        sources = self._conformed_name_sources.setdefault(object_type, {})
+        source = sources.setdefault(conformed, name)
+        if source != name:
+            msg = (
+                "Duplicate stream properties produced when conforming property "
+                f"names: {conformed!r} from {source!r} and {name!r}"
+            )
+            raise ConformedNameClashException(msg)
+        conformed_names[name] = conformed
+        return conformed
+
+    @cached_property
+    def schema_fingerprint(self) -> str:
+        """Fingerprint of the sink's schema, which does not change."""
+        return schema_fingerprint(self.schema)
+
+    def fingerprint(self, schema: dict) -> str:
+        """Return the fingerprint of a schema, computed once for the sink's."""
+        if schema is self.schema:
+            return self.schema_fingerprint
+        return schema_fingerprint(schema)
+
+    def conform_schema(self, schema: dict) -> dict:
+        """Return schema dictionary with property names conformed.
+
+        Conformed schemas are cached by schema fingerprint. The returned
+        schema must not be modified.
+        """
+        fingerprint = self.fingerprint(schema)
+        conformed = self._conformed_schemas.get(fingerprint)
+        if conformed is None:
+            conformed = super().conform_schema(schema)
+            self._conformed_schemas[fingerprint] = conformed
+        return conformed
+
+    def conform_record(self, record: dict) -> dict:
+        """Return record dictionary with property names conformed.
+
+        Clashing names are detected by `conform_name`, so records are not
+        checked for duplicates one by one.
+        """
+        names = self._conformed_names.get(None, {})
+        return {
+            names[key] if key in names else self.conform_name(key): value
+            for key, value in record.items()
+        }
 
     def generate_insert_statement(
         self,
@@ -665,6 +2528,36 @@ class Db2Sink(SQLSink):
         )
         return statement.rstrip()
 
+    @staticmethod
+    def _text(statement: str | Executable) -> Executable:
+        return sa.text(statement) if isinstance(statement, str) else statement
+
+    def generate_positional_insert_statement(
+        self,
+        full_table_name: str,
+        property_names: t.Sequence[str],
+    ) -> str:
+        """Generate an insert statement with positional `?` parameters.
+
+        Args:
+            full_table_name: the target table name.
+            property_names: the properties inserted, in parameter order.
+
+        Returns:
+            An insert statement, to be executed with `exec_driver_sql`.
+        """
+        column_identifiers = [
+            self.connector.quote(quoted_name(self.conform_name(name), quote=True))
+            for name in property_names
+        ]
+        return dedent(
+            f"""\
+            INSERT INTO {self.connector.quote(full_table_name)}
+            ({", ".join(column_identifiers)})
+            VALUES ({", ".join(["?"] * len(column_identifiers))})
+            """,
+        ).rstrip()
+
     def generate_drop_table_statement(self, table_name: str) -> Executable:
         """Drop a table."""
         quoted_name = self.connector.quote(table_name)
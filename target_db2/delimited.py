@@ -0,0 +1,62 @@
+"""Writing of records to delimited (DEL) files, for the Db2 IMPORT & LOAD utilities."""
+
+from __future__ import annotations
+
+import datetime
+import decimal
+import typing as t
+
+# file type modifiers of the written files: UTF-8, and string delimiters taking
+# priority over row delimiters, so strings may hold line breaks
+DEL_MODIFIERS = "CODEPAGE=1208 DELPRIORITYCHAR"
+
+
+def format_value(value: t.Any) -> str:  # noqa: ANN401, PLR0911
+    """Format a value as a field of a DEL file.
+
+    Strings are enclosed in double quotes, doubling the quotes they hold, so
+    they may contain delimiters & line breaks. None is an empty field, loaded
+    as NULL, unlike an empty string. Date-times use Db2's ISO format, without
+    a time zone, as when inserted.
+
+    Raises:
+        ValueError: If the value is an infinite or NaN number, which Db2
+            numeric columns do not hold.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d-%H.%M.%S.%f")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, datetime.time):
+        return value.strftime("%H.%M.%S")
+    if isinstance(value, (decimal.Decimal, float)):
+        number = decimal.Decimal(repr(value)) if isinstance(value, float) else value
+        if not number.is_finite():
+            msg = f"Cannot write non-finite number {value} to a DEL file"
+            raise ValueError(msg)
+        # no exponent, which decimal columns do not accept
+        return format(number, "f")
+    return str(value)
+
+
+def write_delimited(
+    file: t.IO[str],
+    rows: t.Iterable[t.Sequence[t.Any]],
+) -> int:
+    """Write rows to a DEL file, one line per row.
+
+    Returns:
+        The number of rows written.
+    """
+    count = 0
+    for row in rows:
+        file.write(",".join([format_value(value) for value in row]))
+        file.write("\n")
+        count += 1
+    return count
@@ -0,0 +1,61 @@
+"""Client-side membership filter of the keys of a table."""
+
+from __future__ import annotations
+
+import math
+import typing as t
+
+# multiplier deriving the 2nd hash of a key, an odd 64-bit constant
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+class KeyFilter:
+    """Bloom filter of record keys.
+
+    Answers whether a key was possibly added, or was definitely not, using
+    about 10 bits per key for a 1% false positive rate. Keys are hashed with
+    Python's `hash`, so a filter is only valid within the process.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """Initialize an empty filter.
+
+        Args:
+            capacity: Number of keys the filter is sized for. More keys may be
+                added, at the cost of more false positives.
+            error_rate: False positive rate at `capacity` keys.
+        """
+        self.capacity = max(1, capacity)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _hashes(self, key: t.Hashable) -> tuple[int, int]:
+        """Return 2 hashes of the key, combined into `hash_count` positions."""
+        h = hash(key) * HASH_MULTIPLIER
+        return h % self.size, (h >> 64) % self.size or 1
+
+    def add(self, key: t.Hashable) -> None:
+        """Add a key to the filter."""
+        position, step = self._hashes(key)
+        size, bits = self.size, self._bits
+        for _ in range(self.hash_count):
+            bits[position >> 3] |= 1 << (position & 7)
+            position = (position + step) % size
+        self.count += 1
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        """Check if a key was possibly added. False if it definitely was not."""
+        position, step = self._hashes(key)
+        size, bits = self.size, self._bits
+        for _ in range(self.hash_count):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position = (position + step) % size
+        return True
+
+    @property
+    def saturated(self) -> bool:
+        """Check if more keys than `capacity` were added."""
+        return self.count > self.capacity
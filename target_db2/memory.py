@@ -0,0 +1,118 @@
+"""Accounting of memory used by records buffered in sinks."""
+
+from __future__ import annotations
+
+import sys
+import threading
+import typing as t
+
+if t.TYPE_CHECKING:
+    from singer_sdk.sinks import Sink
+
+
+def estimate_size(value: t.Any) -> int:  # noqa: ANN401
+    """Estimate the memory used by a record or value, in bytes.
+
+    Containers are measured recursively. Shared objects are counted every time
+    they are referenced, so the estimate errs on the high side.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            size += estimate_size(v)
+    return size
+
+
+class RecordSizeSampler:
+    """Estimate the memory used by records from a sample of them.
+
+    Every `every`-th record, starting with the first, is measured with
+    `estimate_size`, and every record is estimated at the mean size of the
+    measured ones, so records are not walked on the hot path.
+    """
+
+    def __init__(self, every: int = 100) -> None:
+        """Initialize the sampler.
+
+        Args:
+            every: Measure 1 record out of this many.
+        """
+        self.every = every
+        self._seen = 0
+        self._measured = 0
+        self._measured_bytes = 0
+
+    def __call__(self, record: dict[str, t.Any]) -> int:
+        """Estimate the memory used by a record, in bytes."""
+        if self._seen % self.every == 0:
+            self._measured += 1
+            self._measured_bytes += estimate_size(record)
+        self._seen += 1
+        return self._measured_bytes // self._measured
+
+
+class MemoryAccountant:
+    """Track approximate bytes buffered by each sink of the process.
+
+    Sinks add the size of every record they buffer, and release it when their
+    batch is drained. The current & peak bytes of each sink are kept, so the
+    target can drain the largest sinks when `budget` is exceeded.
+    """
+
+    def __init__(self, budget: int | None = None) -> None:
+        """Initialize the accountant.
+
+        Args:
+            budget: Max bytes to buffer across all sinks, None for no limit.
+        """
+        self.budget = budget
+        self.total_bytes = 0
+        self._current: dict[Sink, int] = {}
+        self._peak: dict[Sink, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, sink: Sink, nbytes: int) -> None:
+        """Account for `nbytes` more buffered by `sink`."""
+        with self._lock:
+            current = self._current.get(sink, 0) + nbytes
+            self._current[sink] = current
+            self.total_bytes += nbytes
+            if current > self._peak.get(sink, 0):
+                self._peak[sink] = current
+
+    def release(self, sink: Sink) -> None:
+        """Release all bytes buffered by `sink`, e.g. after it is drained."""
+        with self._lock:
+            self.total_bytes -= self._current.pop(sink, 0)
+
+    def current_bytes(self, sink: Sink) -> int:
+        """Bytes currently buffered by `sink`."""
+        return self._current.get(sink, 0)
+
+    def peak_bytes(self, sink: Sink) -> int:
+        """Most bytes ever buffered at once by `sink`."""
+        return self._peak.get(sink, 0)
+
+    @property
+    def over_budget(self) -> bool:
+        """Check if buffered bytes across all sinks exceed the budget."""
+        return self.budget is not None and self.total_bytes > self.budget
+
+    def largest_sinks(self) -> list[Sink]:
+        """Sinks holding buffered records, largest first."""
+        with self._lock:
+            return sorted(self._current, key=self._current.__getitem__, reverse=True)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Current & peak buffered bytes, keyed by stream name."""
+        with self._lock:
+            return {
+                sink.stream_name: {
+                    "current_bytes": self._current.get(sink, 0),
+                    "peak_bytes": peak,
+                }
+                for sink, peak in self._peak.items()
+            }
@@ -0,0 +1,241 @@
+"""Serialization of values to and from JSON."""
+
+from __future__ import annotations
+
+import datetime
+import decimal
+import importlib.util
+import json
+import typing as t
+
+JSONSerializer = t.Callable[[t.Any], t.Any]
+JSONDeserializer = t.Callable[[t.Union[bytes, str]], t.Any]
+
+JSON_LIBRARIES = ("orjson", "msgspec", "json")
+
+
+def schema_fingerprint(schema: dict[str, t.Any]) -> str:
+    """Return a string identifying a JSON schema, regardless of key order."""
+    return json.dumps(schema, sort_keys=True, default=str)
+
+
+def _decimal_number(value: decimal.Decimal) -> str:
+    """Format a decimal as a JSON number, without exponent."""
+    return format(value, "f")
+
+
+def _iterencode(
+    value: t.Any,  # noqa: ANN401
+    default: t.Callable[[t.Any], t.Any] | None,
+) -> t.Iterator[str]:
+    if isinstance(value, decimal.Decimal):
+        yield _decimal_number(value)
+    elif isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                yield ", "
+            yield json.dumps(key if isinstance(key, str) else json.dumps(key))
+            yield ": "
+            yield from _iterencode(item, default)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        for i, item in enumerate(value):
+            if i:
+                yield ", "
+            yield from _iterencode(item, default)
+        yield "]"
+    else:
+        yield json.dumps(value, default=default)
+
+
+def _json_dumps(
+    value: t.Any,  # noqa: ANN401
+    default: t.Callable[[t.Any], t.Any] | None = None,
+) -> str:
+    """Serialize a value like `json.dumps`, with decimals as numbers.
+
+    The standard library only encodes decimals through `default`, as other
+    types, so values holding decimals are encoded one container at a time.
+    """
+    try:
+        return json.dumps(value, default=default)
+    except TypeError:
+        return "".join(_iterencode(value, default))
+
+
+def _orjson_dumps() -> t.Callable[[t.Any], str]:
+    import orjson
+
+    # raw JSON embedded in the output, in orjson 3.9.15+
+    fragment = getattr(orjson, "Fragment", None)
+
+    def default(value: t.Any) -> t.Any:  # noqa: ANN401
+        if fragment is not None and isinstance(value, decimal.Decimal):
+            return fragment(_decimal_number(value))
+        raise TypeError
+
+    def dumps(value: t.Any) -> str:  # noqa: ANN401
+        try:
+            return orjson.dumps(value, default=default).decode()
+        except TypeError:
+            # e.g. integers over 64 bits, non-string keys, or decimals
+            return _json_dumps(value)
+
+    return dumps
+
+
+def _msgspec_dumps() -> t.Callable[[t.Any], str]:
+    import msgspec  # type: ignore[import-not-found]
+
+    encode = msgspec.json.Encoder(decimal_format="number").encode
+
+    def dumps(value: t.Any) -> str:  # noqa: ANN401
+        try:
+            return encode(value).decode()
+        except (TypeError, OverflowError):
+            return _json_dumps(value)
+
+    return dumps
+
+
+def get_json_serializer(library: str | None = None) -> JSONSerializer:
+    """Get a function serializing lists & dicts to JSON strings.
+
+    Other values, including strings which may hold already serialized JSON,
+    are returned as-is, so values are never serialized twice. Decimals, as
+    parsed by the SDK, are serialized as numbers.
+
+    Args:
+        library: One of `orjson`, `msgspec` or `json`. By default, the first
+            one installed is used.
+
+    Returns:
+        The serializer function.
+    """
+    if library is None:
+        library = next(
+            lib for lib in JSON_LIBRARIES if importlib.util.find_spec(lib) is not None
+        )
+    if library == "orjson":
+        dumps = _orjson_dumps()
+    elif library == "msgspec":
+        dumps = _msgspec_dumps()
+    else:
+        dumps = _json_dumps
+
+    def serialize(value: t.Any) -> t.Any:  # noqa: ANN401
+        return dumps(value) if isinstance(value, (list, dict)) else value
+
+    return serialize
+
+
+def _db2_value(value: t.Any) -> str:  # noqa: ANN401
+    """Encode a value JSON lacks as a string Db2 casts to the column's type."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d-%H.%M.%S.%f")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    msg = f"Object of type {type(value).__name__} is not JSON serializable"
+    raise TypeError(msg)
+
+
+def get_record_serializer(library: str | None = None) -> t.Callable[[dict], str]:
+    """Get a function serializing whole records to JSON documents for Db2.
+
+    Date-times, dates & times, as parsed by the SDK, are encoded as strings in
+    the formats Db2 casts from, e.g. when projected by JSON_TABLE. Decimals,
+    including nested ones, are encoded as numbers without exponent.
+
+    Args:
+        library: `orjson`, used by default if installed, or `json`. `msgspec`
+            encodes date-times in a format Db2 does not cast, so `json` is
+            used instead.
+
+    Returns:
+        The serializer function.
+    """
+    if library is None and importlib.util.find_spec("orjson") is not None:
+        library = "orjson"
+    if library != "orjson":
+        return lambda record: _json_dumps(record, default=_db2_value)
+
+    import orjson
+
+    # raw JSON embedded in the output, in orjson 3.9.15+
+    fragment = getattr(orjson, "Fragment", None)
+
+    def default(value: t.Any) -> t.Any:  # noqa: ANN401
+        if fragment is not None and isinstance(value, decimal.Decimal):
+            return fragment(_decimal_number(value))
+        return _db2_value(value)
+
+    def dumps(record: dict) -> str:
+        try:
+            return orjson.dumps(
+                record,
+                default=default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            ).decode()
+        except TypeError:
+            # e.g. integers over 64 bits, or decimals
+            return _json_dumps(record, default=_db2_value)
+
+    return dumps
+
+
+# libraries parsing floats to `Decimal` like the SDK, so numbers keep their
+# precision; orjson is only used when chosen explicitly
+JSON_DECIMAL_LIBRARIES = ("msgspec", "json")
+
+
+def _msgspec_loads() -> JSONDeserializer:
+    import msgspec
+
+    decode = msgspec.json.Decoder(float_hook=decimal.Decimal).decode
+
+    def loads(line: bytes | str) -> t.Any:  # noqa: ANN401
+        try:
+            return decode(line)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), str(line), 0) from e
+
+    return loads
+
+
+def _orjson_loads() -> JSONDeserializer:
+    import orjson
+
+    return orjson.loads
+
+
+def _json_loads(line: bytes | str) -> t.Any:  # noqa: ANN401
+    return json.loads(line, parse_float=decimal.Decimal)
+
+
+def get_json_deserializer(library: str | None = None) -> JSONDeserializer:
+    """Get a function parsing a JSON document from bytes or a string.
+
+    Parsing bytes directly saves decoding each line to a string first.
+
+    Args:
+        library: One of `msgspec`, `orjson` or `json`. By default, `msgspec` is
+            used if installed, else `json`. Both parse floats to `Decimal`;
+            `orjson` parses them to `float`, which may lose precision.
+
+    Returns:
+        The deserializer function, raising `json.JSONDecodeError` on
+        invalid JSON.
+    """
+    if library is None:
+        library = next(
+            lib
+            for lib in JSON_DECIMAL_LIBRARIES
+            if importlib.util.find_spec(lib) is not None
+        )
+    if library == "msgspec":
+        return _msgspec_loads()
+    if library == "orjson":
+        return _orjson_loads()
+    return _json_loads
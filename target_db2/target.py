@@ -2,14 +2,243 @@
 
 from __future__ import annotations
 
+import json
+import time
+import typing as t
 from textwrap import dedent
 
 from singer_sdk import typing as th
+from singer_sdk.exceptions import InvalidInputLine
+from singer_sdk.helpers._classproperty import classproperty
+from singer_sdk.helpers.capabilities import CapabilitiesEnum, PluginCapabilities
 from singer_sdk.target_base import Target
 
 from target_db2.connector import (
     Db2Sink,
 )
+from target_db2.memory import MemoryAccountant
+from target_db2.serializers import get_json_deserializer
+
+if t.TYPE_CHECKING:
+    from singer_sdk.connectors.sql import FullyQualifiedName
+
+# bytes read from the input at once
+READ_CHUNK_SIZE = 1024 * 1024
+# seconds between checks of the age of the pending batches of all streams
+BATCH_AGE_CHECK_INTERVAL = 1.0
+
+# settings which may be overridden per stream via `stream_options`, besides
+# `batch_size_rows` which is declared by the SDK
+STREAM_SETTINGS = (
+    th.Property(
+        "max_batch_age_seconds",
+        th.NumberType,
+        description=dedent(
+            """
+            Maximum age of a batch in seconds. A stream's pending batch is
+            drained once it is older than this, regardless of its size.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "batch_buffer",
+        th.StringType,
+        allowed_values=["memory", "disk", "columnar", "arrow"],
+        description=dedent(
+            """
+            Where records are buffered until their batch is loaded. `disk`
+            spills records to a temporary file, bounding memory use regardless
+            of the batch size. `columnar` holds records in memory as one list
+            of values per column, using less memory and CPU per record.
+            `arrow` is `columnar`, with date-time & date strings parsed per
+            batch by Arrow rather than per record. Date-times keep the
+            wall-clock time of their zone offset, as with other buffers. It
+            requires `pyarrow`, and falls back to `columnar` without it.
+            Default `memory`.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "change_detection",
+        th.StringType,
+        allowed_values=["columns", "row_hash"],
+        description=dedent(
+            """
+            Skip updating rows which did not change when merging records into
+            tables with key properties. `columns` compares every non-key
+            column of matched rows. `row_hash` stores a hash of those columns
+            in a `_sdc_row_hash` column and compares it instead, which is
+            cheaper for wide tables. With `sparse_records`, `columns` is used
+            instead of `row_hash`. By default, matched rows are always updated.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "upsert_strategy",
+        th.StringType,
+        allowed_values=["merge", "delete_insert", "update_insert", "auto"],
+        description=dedent(
+            """
+            How records are upserted to tables with key properties. `merge`
+            issues a MERGE statement. `delete_insert` deletes the rows of
+            loaded keys then inserts all records, which is cheaper for
+            updates of column-organized tables. `update_insert` updates the
+            rows of loaded keys then inserts records of new keys, which is
+            cheaper when most keys are new. `auto` counts loaded keys already
+            in the table and picks a strategy for each batch, in the
+            transaction of the upsert. Records of new keys are only inserted
+            without updating rows when the table is locked, see `table_lock`.
+            Default `merge`.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "load_engine",
+        th.StringType,
+        allowed_values=[
+            "insert",
+            "load_from_cursor",
+            "load_from_file",
+            "import_from_file",
+        ],
+        description=dedent(
+            """
+            How records are written to tables. `insert` inserts them.
+            `load_from_cursor` inserts records of tables without key
+            properties, and of new keys found by `known_key_filter`, to a
+            load table, then runs the Db2 LOAD utility from a cursor over it,
+            which writes pages at once without logging rows.
+            `load_from_file` & `import_from_file` write records to delimited
+            files in `bulk_load_directory`, which are loaded by the LOAD or
+            IMPORT utility, to the table or to the load table of upserts.
+            LOAD commits on its own, and requires the LOAD authority. It is
+            NONRECOVERABLE: after a rollforward through it, e.g. restoring a
+            backup, the table is inaccessible and must be dropped & reloaded.
+            IMPORT is logged, fires triggers & keeps the table available.
+            Records rejected when loaded to tables, rather than load tables,
+            are logged as errors, since the other records were committed.
+            Default `insert`.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "stage_format",
+        th.StringType,
+        allowed_values=["columns", "json"],
+        description=dedent(
+            """
+            How records are staged in the load table of upserts. `columns`
+            conforms records and inserts each property to its column. `json`
+            inserts each record whole, as JSON, to a single CLOB column, then
+            projects it to the columns of the table with JSON_TABLE in the
+            upsert statements, so values are converted by Db2 rather than the
+            target. Records are still parsed, validated & serialized by the
+            target. Used instead of `load_engine` for upserts. Default
+            `columns`.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "version_cleanup_chunk_rows",
+        th.IntegerType,
+        description=dedent(
+            """
+            Maximum number of rows of old versions deleted, or marked deleted,
+            in one transaction when an ACTIVATE_VERSION message is received.
+            Rows are cleaned up in chunks each committed separately, so no
+            lock is held for long. By default, rows are cleaned up at once.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "table_lock",
+        th.StringType,
+        allowed_values=["share", "exclusive"],
+        description=dedent(
+            """
+            Lock the table of the stream at the start of every transaction
+            loading records to it. `exclusive` avoids the cost of row locks &
+            their escalation during bulk loads, but blocks readers other than
+            uncommitted reads until the commit. `share` lets others read but
+            not update the table. Time waiting for locks is reported as the
+            `lock_wait_seconds` tag of the `batch_processing_time` metric. By
+            default, tables are not locked.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "known_key_filter",
+        th.BooleanType,
+        description=dedent(
+            """
+            Keep a Bloom filter of the keys of tables with key properties,
+            loaded from the table when the stream starts and updated after
+            every batch. Records whose key is definitely new are inserted
+            directly, and only the others are merged. Suited to append-heavy
+            streams, e.g. events with growing ids. Only integer & string key
+            properties are supported. Default false.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "upsert_chunk_rows",
+        th.IntegerType,
+        description=dedent(
+            """
+            Maximum number of records staged & upserted in one transaction.
+            Larger batches are upserted in chunks of this many records, each
+            committed separately, bounding the log space & row locks used, to
+            avoid full transaction logs & lock escalation. A failed batch may
+            be partially committed, and is upserted again when the stream is
+            resumed. By default, a batch is upserted in one transaction.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "sparse_records",
+        th.BooleanType,
+        description=dedent(
+            """
+            Records may hold only some properties of their stream, e.g. only
+            changed columns. Records are merged in groups of records having
+            the same properties, and only those columns are updated. Records
+            with the same key in a batch are merged. Records are always
+            buffered in memory, whatever the `batch_buffer`. Default false.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "adaptive_batch_size",
+        th.BooleanType,
+        description=dedent(
+            """
+            Adjust the batch size after every batch based on measured load
+            throughput, within `min_batch_size_rows` and `max_batch_size_rows`.
+            Default false.
+            """
+        ).strip(),
+    ),
+    th.Property(
+        "min_batch_size_rows",
+        th.IntegerType,
+        description="Smallest batch size used by adaptive batch sizing. Default 1000.",
+    ),
+    th.Property(
+        "max_batch_size_rows",
+        th.IntegerType,
+        description="Largest batch size used by adaptive batch sizing. Default 100000.",
+    ),
+    th.Property(
+        "target_batch_latency_seconds",
+        th.NumberType,
+        description=dedent(
+            """
+            Adaptive batch sizing shrinks batches taking longer than this to
+            load, and only grows batches expected to load within it. Default 60.
+            """
+        ).strip(),
+    ),
+)
 
 
 class TargetDb2(Target):
@@ -61,14 +290,267 @@ class TargetDb2(Target):
                 """
             ).strip(),
         ),
+        th.Property(
+            "max_buffer_memory_mb",
+            th.NumberType,
+            description=dedent(
+                """
+                Approximate memory budget for records buffered across all
+                streams. When exceeded, streams buffering the most memory are
+                drained first until usage is back under budget. Record sizes
+                are estimated from 1 in 100 records, and only when set.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "spill_directory",
+            th.StringType,
+            description=dedent(
+                """
+                Directory of the temporary files used by the `disk` batch buffer.
+                Defaults to the system's temporary directory.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "bulk_load_directory",
+            th.StringType,
+            description=dedent(
+                """
+                Directory of the delimited files of the `load_from_file` &
+                `import_from_file` load engines, which the Db2 server must
+                read, e.g. a volume shared with its container. Defaults to the
+                system's temporary directory, when running on the Db2 host.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "bulk_load_server_directory",
+            th.StringType,
+            description=dedent(
+                """
+                Path of `bulk_load_directory` on the Db2 server, e.g. where the
+                shared volume is mounted in its container. Must not hold
+                spaces. Defaults to `bulk_load_directory`.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "json_serializer",
+            th.StringType,
+            allowed_values=["orjson", "msgspec", "json"],
+            description=dedent(
+                """
+                Library used to serialize object & array values to JSON.
+                Defaults to the fastest one installed, `json` being the
+                standard library.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "json_deserializer",
+            th.StringType,
+            allowed_values=["msgspec", "orjson", "json"],
+            description=dedent(
+                """
+                Library used to parse input messages. Defaults to `msgspec` if
+                installed, else `json`, the standard library. Both parse
+                numbers with decimals exactly; `orjson` is faster but parses
+                them to floats, which may lose precision.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "validation_mode",
+            th.StringType,
+            allowed_values=["full", "sampled", "off"],
+            description=dedent(
+                """
+                Validation of records against the schema of their stream:
+                `full` validates every record, `sampled` 1 in
+                `validation_sample_rate` records, and `off` none, e.g. for
+                trusted taps. Default `full`.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "validation_sample_rate",
+            th.IntegerType,
+            description=dedent(
+                """
+                With `validation_mode` set to `sampled`, validate 1 record out
+                of this many. Default 100.
+                """
+            ).strip(),
+        ),
+        th.Property(
+            "hard_delete",
+            th.BooleanType,
+            description=dedent(
+                """
+                Delete the rows of records having a `_sdc_deleted_at` time, e.g.
+                from log-based replication, instead of storing the deletion
+                time. Deletes are applied to streams with key properties, with
+                1 statement per batch in the transaction of the upsert. Old
+                versions are deleted on ACTIVATE_VERSION. Default false.
+                """
+            ).strip(),
+        ),
+        *STREAM_SETTINGS,
+        th.Property(
+            "stream_options",
+            th.ObjectType(
+                additional_properties=th.ObjectType(
+                    th.Property(
+                        "batch_size_rows",
+                        th.IntegerType,
+                        description="Maximum number of rows in each batch.",
+                    ),
+                    *STREAM_SETTINGS,
+                )
+            ),
+            description=dedent(
+                """
+                Per-stream overrides of stream settings, keyed by stream name.
+                For example: `{"public-events": {"batch_size_rows": 100000}}`
+                """
+            ).strip(),
+        ),
     ).to_dict()
 
-    # Make following user-configurable:
-    # - batch size
-    # - timeout
-
     default_sink_class = Db2Sink
 
+    @classproperty
+    def capabilities(self) -> list[CapabilitiesEnum]:
+        """Get target capabilities, including loading BATCH messages."""
+        return [*super().capabilities, PluginCapabilities.BATCH]  # type: ignore[misc]
+
+    def __init__(self, *args, **kwargs) -> None:  # noqa: ANN002, ANN003
+        """Initialize the target."""
+        super().__init__(*args, **kwargs)
+        max_buffer_memory_mb = self.config.get("max_buffer_memory_mb")
+        # records are only measured when their memory is budgeted
+        self.memory_accountant: MemoryAccountant | None = (
+            MemoryAccountant(budget=int(max_buffer_memory_mb * 1024 * 1024))
+            if max_buffer_memory_mb
+            else None
+        )
+        self._json_loads = get_json_deserializer(self.config.get("json_deserializer"))
+        # shadow tables of `overwrite` loads, see `Db2Sink.full_table_name`
+        self.shadow_tables: dict[FullyQualifiedName, Db2Sink] = {}
+        # see `_handle_max_record_age`
+        self._next_batch_age_check = 0.0
+
+    def deserialize_json(self, line: bytes | str) -> dict:  # type: ignore[override]
+        """Parse a message from a line of JSON, as bytes or a string.
+
+        Raises:
+            InvalidInputLine: If the line is not valid JSON.
+        """
+        try:
+            return self._json_loads(line)
+        except json.JSONDecodeError as e:
+            self.logger.exception("Unable to parse:\n%s", line)
+            msg = f"Unable to parse line as JSON: {line!r}"
+            raise InvalidInputLine(msg) from e
+
+    def _process_lines(self, file_input: t.IO[str]) -> t.Counter[str]:
+        """Process messages read from the input in large binary chunks."""
+        return super()._process_lines(
+            self._read_lines(file_input),  # type: ignore[arg-type]
+        )
+
+    @staticmethod
+    def _read_lines(file_input: t.IO[str]) -> t.Iterator[bytes | str]:
+        """Iterate over the non-empty lines of the input.
+
+        The binary stream underlying a text input, such as stdin, is read
+        in chunks of up to `READ_CHUNK_SIZE` bytes and split into lines of
+        bytes, so lines are never decoded to strings. Each chunk is what is
+        available at once, so lines from a pipe are processed as they arrive.
+        Binary streams without `read1` are read line by line, as are inputs
+        without an underlying binary stream.
+        """
+        stream: t.IO[bytes] | None = getattr(file_input, "buffer", None)
+        if stream is None:
+            yield from (line for line in file_input if not line.isspace())
+            return
+        read1: t.Callable[[int], bytes] | None = getattr(stream, "read1", None)
+        if read1 is None:
+            yield from (
+                line for line in iter(stream.readline, b"") if not line.isspace()
+            )
+            return
+        pending = b""
+        while chunk := read1(READ_CHUNK_SIZE):
+            lines = chunk.split(b"\n")
+            lines[0] = pending + lines[0]
+            pending = lines.pop()
+            yield from (line for line in lines if line and not line.isspace())
+        if pending and not pending.isspace():
+            yield pending
+
+    def _process_activate_version_message(self, message_dict: dict) -> None:
+        """Load the records buffered for the stream, then activate the version.
+
+        Rows that buffered records update are so never deleted as rows of an
+        older version first, leaving a gap until the batch is loaded.
+        """
+        for stream_map in self.mapper.stream_maps[message_dict["stream"]]:
+            self.drain_one(self.get_sink(stream_map.stream_alias))
+        super()._process_activate_version_message(message_dict)
+
+    def _process_batch_message(self, message_dict: dict) -> None:
+        """Load the records buffered for the stream, then the batch files.
+
+        Records of the files so update rows after the records received before.
+        """
+        self.drain_one(self.get_sink(message_dict["stream"]))
+        super()._process_batch_message(message_dict)
+
+    def _process_record_message(self, message_dict: dict) -> None:
+        """Process a RECORD message, then enforce the memory budget."""
+        super()._process_record_message(message_dict)
+        if self.memory_accountant and self.memory_accountant.over_budget:
+            self._drain_largest_sinks(self.memory_accountant)
+
+    def _drain_largest_sinks(self, accountant: MemoryAccountant) -> None:
+        """Drain sinks using the most memory until back under budget."""
+        for sink in accountant.largest_sinks():
+            self.logger.info(
+                "Buffered records exceed the memory budget. Draining '%s' "
+                "holding %d bytes...",
+                sink.stream_name,
+                accountant.current_bytes(sink),
+            )
+            self.drain_one(sink)
+            if not accountant.over_budget:
+                break
+
+    def _handle_max_record_age(self) -> None:
+        """Drain sinks whose pending batch exceeded `max_batch_age_seconds`.
+
+        Checked at most every `BATCH_AGE_CHECK_INTERVAL` seconds, rather than
+        after every record, so trickle streams are flushed on time even when
+        records keep arriving for other streams only. The sink receiving a
+        record checks its own batch age, see `Db2Sink.is_full`.
+        """
+        now = time.monotonic()
+        if now >= self._next_batch_age_check:
+            self._next_batch_age_check = now + BATCH_AGE_CHECK_INTERVAL
+            self._drain_expired_batches()
+        super()._handle_max_record_age()
+
+    def _drain_expired_batches(self) -> None:
+        """Drain sinks whose pending batch exceeded `max_batch_age_seconds`."""
+        for sink in list(self._sinks_active.values()):
+            if isinstance(sink, Db2Sink) and sink.batch_age_exceeded:
+                self.logger.info(
+                    "Batch for '%s' exceeded its max age. Draining...",
+                    sink.stream_name,
+                )
+                self.drain_one(sink)
+
 
 if __name__ == "__main__":
     TargetDb2.cli()
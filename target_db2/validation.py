@@ -0,0 +1,119 @@
+"""Validation of records against the JSON schema of their stream."""
+
+from __future__ import annotations
+
+import importlib.util
+import typing as t
+
+from singer_sdk.exceptions import InvalidJSONSchema, InvalidRecord
+from singer_sdk.sinks.core import BaseJSONSchemaValidator, JSONSchemaValidator
+
+from target_db2.serializers import schema_fingerprint
+
+# validators compiled by schema fingerprint & format validation, shared across
+# sinks since compiling a schema is costly and streams often share schemas
+_compiled_validators: dict[tuple[str, bool], BaseJSONSchemaValidator] = {}
+
+
+class CompiledJSONSchemaValidator(BaseJSONSchemaValidator):
+    """Validate records with a function generated from the schema.
+
+    Uses the `fastjsonschema` library, which compiles the schema to Python
+    code once instead of interpreting it for every record.
+    """
+
+    def __init__(
+        self,
+        schema: dict[str, t.Any],
+        *,
+        validate_formats: bool = False,
+    ) -> None:
+        """Initialize the validator.
+
+        Args:
+            schema: Schema of the stream to sink.
+            validate_formats: Whether JSON string formats should be validated.
+
+        Raises:
+            InvalidJSONSchema: If the schema is invalid.
+        """
+        import fastjsonschema  # type: ignore[import-untyped]
+
+        super().__init__(schema)
+        try:
+            self.validator = fastjsonschema.compile(
+                schema,
+                use_formats=validate_formats,
+                use_default=False,
+            )
+        except fastjsonschema.JsonSchemaDefinitionException as e:
+            msg = f"Schema Validation Error: {e}"
+            raise InvalidJSONSchema(msg) from e
+        self._value_exception = fastjsonschema.JsonSchemaValueException
+
+    def validate(self, record: dict[str, t.Any]) -> None:
+        """Validate a record.
+
+        Raises:
+            InvalidRecord: If the record is invalid.
+        """
+        try:
+            self.validator(record)
+        except self._value_exception as e:
+            raise InvalidRecord(e.message, record) from e
+
+
+def get_compiled_validator(
+    schema: dict[str, t.Any],
+    *,
+    validate_formats: bool = False,
+) -> BaseJSONSchemaValidator:
+    """Get the validator of a schema, compiled once per distinct schema.
+
+    Schemas are compiled with `fastjsonschema` if installed, else the SDK's
+    `jsonschema` validator is used.
+    """
+    key = (schema_fingerprint(schema), validate_formats)
+    validator = _compiled_validators.get(key)
+    if validator is None:
+        if importlib.util.find_spec("fastjsonschema") is not None:
+            validator = CompiledJSONSchemaValidator(
+                schema,
+                validate_formats=validate_formats,
+            )
+        else:
+            validator = JSONSchemaValidator(
+                schema,
+                validate_formats=validate_formats,
+            )
+        _compiled_validators[key] = validator
+    return validator
+
+
+class SampledValidator(BaseJSONSchemaValidator):
+    """Validate 1 in `every` records, counting records seen & validated."""
+
+    def __init__(self, validator: BaseJSONSchemaValidator, every: int = 1) -> None:
+        """Initialize the validator.
+
+        Args:
+            validator: Validator of the sampled records.
+            every: Validate one record out of this many, the first included.
+        """
+        super().__init__(validator.schema)
+        self.validator = validator
+        self.every = max(1, every)
+        self.records_seen = 0
+        self.records_validated = 0
+
+    def validate(self, record: dict[str, t.Any]) -> None:
+        """Validate the record if it is sampled.
+
+        Raises:
+            InvalidRecord: If the record is sampled and invalid.
+        """
+        self.records_seen += 1
+        if (self.records_seen - 1) % self.every:
+            return
+        self.records_validated += 1
+        self.validator.validate(record)
@@ -2,10 +2,29 @@
 
 from __future__ import annotations
 
+import contextlib
+import datetime
+import decimal
+import gzip
+import importlib.util
+import io
+import json
+import logging
 import os
+import re
+import threading
+import time
 import typing as t
+from types import SimpleNamespace
 
 import pytest
+import sqlalchemy as sa
+from singer_sdk.exceptions import (
+    ConformedNameClashException,
+    InvalidInputLine,
+    InvalidRecord,
+)
+from singer_sdk.helpers._batch import BaseBatchFileEncoding
 from singer_sdk.helpers._compat import importlib_resources
 from singer_sdk.testing import get_target_test_class
 from singer_sdk.testing.suites import TestSuite as TS  # noqa: N817
@@ -24,13 +43,31 @@ from sqlalchemy import (
 )
 from sqlalchemy.schema import DropTable
 
-from target_db2.connector import JSONVARCHAR, DB2Connector
+from target_db2 import connector as connector_module
+from target_db2 import target as target_module
+from target_db2.arrow import parse_datelike
+from target_db2.batching import AdaptiveBatchSizer, PhaseTimer
+from target_db2.buffers import (
+    ColumnarRecordBuffer,
+    ConvertedColumnarRecordBuffer,
+    RecordBuffer,
+    SpillRecordBuffer,
+    StreamedRecordBuffer,
+)
+from target_db2.connector import JSONVARCHAR, ROW_HASH_COLUMN, DB2Connector, Db2Sink
+from target_db2.delimited import write_delimited
+from target_db2.keys import KeyFilter
+from target_db2.memory import RecordSizeSampler, estimate_size
+from target_db2.serializers import get_json_serializer, get_record_serializer
 from target_db2.target import TargetDb2
+from target_db2.validation import CompiledJSONSchemaValidator, SampledValidator
 from tests import testdata
 
 if t.TYPE_CHECKING:
+    from pathlib import Path
+
     from singer_sdk.helpers._compat import Traversable
-    from sqlalchemy.engine.base import Engine
+    from sqlalchemy.engine.base import Connection, Engine
 
 
 SAMPLE_CONFIG: dict[str, t.Any] = {
@@ -209,3 +246,1045 @@ def test_alter_column() -> None:
             if _type[0] == "VAL":
                 assert _type[1:4] == ("DECIMAL", 10, 3)
         conn.execute(text("drop table test_alter_column"))
+
+
+def test_stream_options_override_batch_settings() -> None:
+    """Test per-stream batch size and max batch age overrides."""
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "batch_size_rows": 50,
+            "stream_options": {
+                "fast_stream": {"batch_size_rows": 5, "max_batch_age_seconds": 60},
+            },
+        }
+    )
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    fast_sink = Db2Sink(target, "fast_stream", schema, ["id"])
+    other_sink = Db2Sink(target, "other_stream", schema, ["id"])
+    assert fast_sink.max_size == 5
+    assert other_sink.max_size == 50
+
+    fast_sink._get_context({})  # noqa: SLF001
+    assert not fast_sink.batch_age_exceeded
+    fast_sink._batch_started_at = time.monotonic() - 61  # noqa: SLF001
+    assert fast_sink.batch_age_exceeded
+    assert fast_sink.is_full
+    assert not other_sink.batch_age_exceeded
+
+
+def test_batch_ages_checked_once_per_interval(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the batches of all streams are not checked after every record."""
+    target = TargetDb2(config=SAMPLE_CONFIG)
+    checks = []
+    monkeypatch.setattr(target, "_drain_expired_batches", lambda: checks.append(1))
+    for _ in range(100):
+        target._handle_max_record_age()  # noqa: SLF001
+    assert len(checks) == 1
+    target._next_batch_age_check = 0.0  # noqa: SLF001
+    target._handle_max_record_age()  # noqa: SLF001
+    assert len(checks) == 2
+
+
+def test_adaptive_batch_sizer() -> None:
+    """Test batches grow while under the latency target and shrink above it."""
+    sizer = AdaptiveBatchSizer(
+        initial_size=1000,
+        min_size=500,
+        max_size=2000,
+        target_latency=10,
+        logger=logging.getLogger("test"),
+    )
+    timer = PhaseTimer()
+    timer.seconds = {"stage": 1.0, "merge": 0.5, "commit": 0.5}
+    assert sizer.record_batch(1000, timer) == 1500
+    assert sizer.record_batch(1500, timer) == 2000
+    # bounded by max_size
+    assert sizer.record_batch(2000, timer) == 2000
+    timer.seconds = {"stage": 10.0, "merge": 5.0, "commit": 5.0}
+    assert sizer.record_batch(2000, timer) == 1000
+    # bounded by min_size
+    timer.seconds = {"stage": 100.0}
+    assert sizer.record_batch(1000, timer) == 500
+
+
+def test_memory_accountant_drains_largest_sinks_first() -> None:
+    """Test buffered bytes are tracked per sink and largest sinks sort first."""
+    target = TargetDb2(config={**SAMPLE_CONFIG, "max_buffer_memory_mb": 0.01})
+    accountant = target.memory_accountant
+    schema = {"properties": {"id": {"type": ["integer"]}, "v": {"type": ["string"]}}}
+    small_sink = Db2Sink(target, "small_stream", schema, ["id"])
+    large_sink = Db2Sink(target, "large_stream", schema, ["id"])
+    for i in range(10):
+        for sink, size in ((small_sink, 10), (large_sink, 1000)):
+            sink.process_record({"id": i, "v": "x" * size}, sink._get_context({}))  # noqa: SLF001
+
+    assert accountant.over_budget
+    assert accountant.largest_sinks() == [large_sink, small_sink]
+    large_bytes = accountant.current_bytes(large_sink)
+    assert large_bytes > 10 * 1000
+
+    large_sink.mark_drained()
+    assert accountant.current_bytes(large_sink) == 0
+    assert accountant.peak_bytes(large_sink) == large_bytes
+    assert accountant.total_bytes == accountant.current_bytes(small_sink)
+    assert not accountant.over_budget
+
+
+def test_spill_record_buffer_deduplicates_on_disk(tmp_path: Path) -> None:
+    """Test records round-trip through the disk buffer and are deduplicated."""
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "batch_buffer": "disk",
+            "spill_directory": str(tmp_path),
+        }
+    )
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            "updated_at": {"type": ["string"], "format": "date-time"},
+        }
+    }
+    sink = Db2Sink(target, "spilled_stream", schema, ["id"])
+    context = sink._get_context({})  # noqa: SLF001
+    buffer = context["records"]
+    assert isinstance(buffer, SpillRecordBuffer)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    for i in range(10):
+        sink.process_record({"id": i % 3, "updated_at": now, "seq": i}, context)
+
+    assert len(buffer) == 3
+    assert buffer.nbytes == 0
+    records = list(buffer)
+    assert [rec["seq"] for rec in records] == [7, 8, 9]
+    assert records[0]["updated_at"] == now
+    buffer.close()
+
+
+def test_columnar_record_buffer() -> None:
+    """Test the columnar buffer keeps the latest record per key as tuples."""
+    buffer = ColumnarRecordBuffer(columns=["id", "name", "tags"], key_properties=["id"])
+    for i in range(6):
+        buffer.append({"id": i % 3, "name": f"name_{i}", "tags": [i]})
+    buffer.append({"id": 4, "ignored": True})
+
+    assert len(buffer) == 4
+    buffer.map_column("tags", get_json_serializer("json"))
+    assert list(buffer.rows(["id", "name", "tags"])) == [
+        (0, "name_3", "[3]"),
+        (1, "name_4", "[4]"),
+        (2, "name_5", "[5]"),
+        (4, None, None),
+    ]
+    assert next(iter(buffer)) == {"id": 0, "name": "name_3", "tags": "[3]"}
+
+
+def test_arrow_batch_buffer_parses_dates_per_batch(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test date-like strings are buffered as is, and parsed per column."""
+    calls = []
+
+    def parse(values: list, datelike_type: str) -> tuple[list, list[int]]:
+        calls.append(datelike_type)
+        if datelike_type == "date":
+            # the last date left to be parsed value by value
+            parsed = [datetime.date.fromisoformat(v) for v in values[:-1]]
+            return [*parsed, None], [len(values) - 1]
+        msg = "invalid date"
+        raise ValueError(msg)
+
+    monkeypatch.setattr(connector_module, "arrow_installed", lambda: True)
+    monkeypatch.setattr(connector_module, "parse_datelike", parse)
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            "at": {"type": ["string", "null"], "format": "date-time"},
+            "on": {"type": ["string"], "format": "date"},
+        }
+    }
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "batch_buffer": "arrow",
+            "add_record_metadata": False,
+        }
+    )
+    sink = Db2Sink(target, "dated", schema, ["id"])
+    context = sink._get_context({})  # noqa: SLF001
+    for i in range(3):
+        record = {"id": i % 2, "at": f"2024-01-0{i + 1}T00:00:00", "on": "2024-02-01"}
+        sink._validate_and_parse(record)  # noqa: SLF001
+        sink.process_record(record, context)
+    sink.process_record({"id": 5, "at": None, "on": "2024-02-02"}, context)
+
+    buffer = sink._pending_batch["records"]  # type: ignore[index]  # noqa: SLF001
+    assert isinstance(buffer, ConvertedColumnarRecordBuffer)
+    assert list(buffer.rows(["id", "at", "on"])) == [
+        (0, datetime.datetime(2024, 1, 3), datetime.date(2024, 2, 1)),  # noqa: DTZ001
+        (1, datetime.datetime(2024, 1, 2), datetime.date(2024, 2, 1)),  # noqa: DTZ001
+        (5, None, datetime.date(2024, 2, 2)),
+    ]
+    # columns are parsed once, date-times value by value after Arrow failed
+    list(buffer)
+    assert sorted(calls) == ["date", "date-time"]
+
+
+def test_parse_datelike_with_arrow() -> None:
+    """Test Arrow parses date-times to their wall-clock time, and dates."""
+    pytest.importorskip("pyarrow")
+    values = [
+        "2024-01-02T03:04:05.5+01:00",
+        None,
+        "2024-01-02 03:04:05Z",
+        "2024-01-02T03:04:05",
+        "Jan 2, 2024",
+    ]
+    assert parse_datelike(values, "date-time") == (
+        [
+            datetime.datetime(2024, 1, 2, 3, 4, 5, 500000),  # noqa: DTZ001
+            None,
+            datetime.datetime(2024, 1, 2, 3, 4, 5),  # noqa: DTZ001
+            datetime.datetime(2024, 1, 2, 3, 4, 5),  # noqa: DTZ001
+            None,
+        ],
+        [4],
+    )
+    assert parse_datelike(["2024-01-02", None, "2024"], "date") == (
+        [datetime.date(2024, 1, 2), None, None],
+        [2],
+    )
+    with pytest.raises(ValueError):  # noqa: PT011
+        parse_datelike(["2024-02-30"], "date")
+
+
+def test_arrow_batch_buffer_matches_sdk_parsing() -> None:
+    """Test the Arrow batch buffer parses date-likes as written by the SDK."""
+    pytest.importorskip("pyarrow")
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            "at": {"type": ["string", "null"], "format": "date-time"},
+            "on": {"type": ["string", "null"], "format": "date"},
+        }
+    }
+    records = [
+        {"id": 1, "at": "2024-01-02T03:04:05.123456-05:00", "on": "2024-02-01"},
+        {"id": 2, "at": None, "on": None},
+        {"id": 3, "at": "2024-01-02T03:04", "on": "2024-02-29"},
+    ]
+    parsed_rows = {}
+    for batch_buffer in ("memory", "arrow"):
+        target = TargetDb2(
+            config={
+                **SAMPLE_CONFIG,
+                "batch_buffer": batch_buffer,
+                "add_record_metadata": False,
+            }
+        )
+        sink = Db2Sink(target, "dated", schema, ["id"])
+        context = sink._get_context({})  # noqa: SLF001
+        for record in records:
+            record = dict(record)  # noqa: PLW2901
+            sink._validate_and_parse(record)  # noqa: SLF001
+            sink.process_record(record, context)
+        buffer = sink._pending_batch["records"]  # type: ignore[index]  # noqa: SLF001
+        parsed_rows[batch_buffer] = [
+            (rec["id"], rec["at"] and rec["at"].replace(tzinfo=None), rec["on"])
+            for rec in buffer
+        ]
+    assert isinstance(buffer, ConvertedColumnarRecordBuffer)
+    assert parsed_rows["arrow"] == parsed_rows["memory"]
+    assert parsed_rows["arrow"][0][1] == datetime.datetime(2024, 1, 2, 3, 4, 5, 123456)  # noqa: DTZ001
+
+
+def test_process_record_deduplicates_on_ingest() -> None:
+    """Test superseded records are replaced in the buffer & tallied as merged."""
+    target = TargetDb2(config=SAMPLE_CONFIG)
+    schema = {"properties": {"id": {"type": ["integer"]}, "v": {"type": ["string"]}}}
+    sink = Db2Sink(target, "cdc_stream", schema, ["id"])
+    for i in range(100):
+        sink.tally_record_read()
+        sink.process_record({"id": i % 5, "v": "x" * i}, sink._get_context({}))  # noqa: SLF001
+
+    buffer = sink._pending_batch["records"]  # type: ignore[index]  # noqa: SLF001
+    assert [rec["v"] for rec in buffer] == ["x" * i for i in range(95, 100)]
+    # records are not measured without a memory budget
+    assert target.memory_accountant is None
+    assert buffer.nbytes == 0
+    sink.mark_drained()
+    assert sink._total_records_written == 5  # noqa: SLF001
+
+
+def test_record_size_sampler() -> None:
+    """Test records are estimated from a sample of them, 1st one included."""
+    sampler = RecordSizeSampler(every=10)
+    small = {"v": "x"}
+    large = {"v": "x" * 1000}
+    assert sampler(small) == estimate_size(small)
+    # not measured
+    assert sampler(large) == estimate_size(small)
+    for _ in range(8):
+        sampler(small)
+    assert sampler(large) == (estimate_size(small) + estimate_size(large)) // 2
+
+
+def test_json_varchar_round_trips_strings() -> None:
+    """Test JSON strings are encoded by the column type, like other values."""
+    json_type = JSONVARCHAR(100)
+    for value in ("abc", '{"a": 1}', {"a": "b"}, [1, "x"], None):
+        bound = json_type.process_bind_param(value, None)
+        assert json_type.process_result_value(bound, None) == value
+
+
+@pytest.mark.parametrize("library", ["orjson", "msgspec", "json"])
+def test_json_serializer_never_double_encodes(library: str) -> None:
+    """Test containers are serialized once, and other values passed through."""
+    pytest.importorskip(library)
+    serialize = get_json_serializer(library)
+    value = {"a": [1, 2.5, None, "x"], "big": 2**70}
+    serialized = serialize(value)
+    assert json.loads(serialized) == value
+    assert serialize(serialized) == serialized
+    assert serialize(None) is None
+    assert serialize(1) == 1
+
+
+def test_read_lines_from_pipe_as_they_arrive() -> None:
+    """Test a line is read from a pipe without waiting for a full chunk."""
+    read_fd, write_fd = os.pipe()
+    first_line_read = threading.Event()
+    second_line_written = threading.Event()
+
+    def write() -> None:
+        with open(write_fd, "wb") as pipe:  # noqa: PTH123
+            pipe.write(b'{"id": 1}\n')
+            pipe.flush()
+            first_line_read.wait(timeout=5)
+            pipe.write(b'{"id": 2}\n')
+            second_line_written.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    with io.TextIOWrapper(open(read_fd, "rb")) as file_input:  # noqa: PTH123
+        lines = TargetDb2._read_lines(file_input)  # noqa: SLF001
+        assert next(lines) == b'{"id": 1}'
+        assert not second_line_written.is_set()
+        first_line_read.set()
+        assert list(lines) == [b'{"id": 2}']
+    writer.join()
+
+
+@pytest.mark.parametrize("library", ["orjson", "msgspec", "json"])
+def test_json_serializer_keeps_decimals_as_numbers(library: str) -> None:
+    """Test decimals round-trip as exact JSON numbers, not strings."""
+    pytest.importorskip(library)
+    serialize = get_json_serializer(library)
+    value = {
+        "amount": decimal.Decimal("1.10"),
+        "items": [decimal.Decimal("-0.000001"), {"big": 2**70}],
+        "total": {"value": decimal.Decimal("12345678901234567890.123"), "n": 1},
+    }
+    serialized = serialize(value)
+    assert '"1.10"' not in serialized
+    assert json.loads(serialized, parse_float=decimal.Decimal) == value
+    assert "12345678901234567890.123" in serialized
+
+
+@pytest.mark.parametrize("library", ["msgspec", "json"])
+def test_read_messages_in_binary_chunks(
+    library: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test lines split across chunks are parsed, with exact decimals."""
+    pytest.importorskip(library)
+    monkeypatch.setattr(target_module, "READ_CHUNK_SIZE", 7)
+    target = TargetDb2(config={**SAMPLE_CONFIG, "json_deserializer": library})
+    messages = [
+        {"type": "RECORD", "stream": "s", "record": {"id": i, "amount": "1.10"}}
+        for i in range(3)
+    ]
+    data = "\n\n".join(json.dumps(m) for m in messages).replace('"1.10"', "1.10")
+    lines = list(target._read_lines(io.TextIOWrapper(io.BytesIO(data.encode()))))  # noqa: SLF001
+    assert all(isinstance(line, bytes) for line in lines)
+    parsed = [target.deserialize_json(line) for line in lines]
+    assert [m["record"]["id"] for m in parsed] == [0, 1, 2]
+    assert parsed[0]["record"]["amount"] == decimal.Decimal("1.10")
+    with pytest.raises(InvalidInputLine):
+        target.deserialize_json(b"{not json")
+
+
+def test_validation_modes() -> None:
+    """Test full, sampled & disabled validation, and compiled validator reuse."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    full = Db2Sink(TargetDb2(config=SAMPLE_CONFIG), "full", schema, ["id"])
+    sampled = Db2Sink(
+        TargetDb2(
+            config={
+                **SAMPLE_CONFIG,
+                "validation_mode": "sampled",
+                "validation_sample_rate": 3,
+            }
+        ),
+        "sampled",
+        schema,
+        ["id"],
+    )
+    off = Db2Sink(
+        TargetDb2(config={**SAMPLE_CONFIG, "validation_mode": "off"}),
+        "off",
+        schema,
+        ["id"],
+    )
+    assert off._validator is None  # noqa: SLF001
+    assert isinstance(full._validator, SampledValidator)  # noqa: SLF001
+    assert isinstance(sampled._validator, SampledValidator)  # noqa: SLF001
+    # compiled once for both sinks
+    assert full._validator.validator is sampled._validator.validator  # noqa: SLF001
+    if importlib.util.find_spec("fastjsonschema"):
+        assert isinstance(full._validator.validator, CompiledJSONSchemaValidator)  # noqa: SLF001
+
+    for i in range(6):
+        full._validator.validate({"id": i})  # noqa: SLF001
+        # only the 1st & 4th records are validated
+        sampled._validator.validate({"id": "invalid"} if i % 3 else {"id": i})  # noqa: SLF001
+    assert full._validator.records_validated == 6  # noqa: SLF001
+    assert sampled._validator.records_seen == 6  # noqa: SLF001
+    assert sampled._validator.records_validated == 2  # noqa: SLF001
+    with pytest.raises(InvalidRecord):
+        full._validator.validate({"id": "invalid"})  # noqa: SLF001
+
+
+def test_conformed_names_and_schema_are_memoized() -> None:
+    """Test names & schemas are conformed once, and name clashes detected."""
+    schema = {"properties": {"a.b": {"type": ["string"]}, "1c": {"type": ["string"]}}}
+    sink = Db2Sink(TargetDb2(config=SAMPLE_CONFIG), "memo", schema, [])
+    conformed_schema = sink.conform_schema(sink.schema)
+    assert list(conformed_schema["properties"])[:2] == ["a_b", "bc"]
+    assert sink.conform_schema(dict(sink.schema)) is conformed_schema
+    assert sink.conform_record({"a.b": 1, "1c": 2}) == {"a_b": 1, "bc": 2}
+    # a table may share a column's conformed name
+    assert sink.conform_name("a_b", "table") == "a_b"
+    with pytest.raises(ConformedNameClashException):
+        sink.conform_record({"a_b": 1})
+
+
+def test_statements_are_built_once_per_sink() -> None:
+    """Test SQL statements are built on first use, then reused."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    sink = Db2Sink(TargetDb2(config=SAMPLE_CONFIG), "cached", schema, ["id"])
+    built = []
+
+    def build_merge() -> t.Any:  # noqa: ANN401
+        built.append(1)
+        return sink.merge_upsert_from_table("ft", "lt", ["id"])
+
+    merge_sql = sink.cached_statement(("merge", "ft", "lt"), build_merge)
+    assert sink.cached_statement(("merge", "ft", "lt"), build_merge) is merge_sql
+    assert len(built) == 1
+    assert "MERGE INTO ft" in str(merge_sql)
+
+
+def test_change_detecting_merge() -> None:
+    """Test matched rows are only updated when compared columns changed."""
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            "name": {"type": ["string", "null"]},
+            "_sdc_deleted_at": {"type": ["string", "null"], "format": "date-time"},
+        }
+    }
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "change_detection": "columns",
+            "stream_options": {"hashed": {"change_detection": "row_hash"}},
+        }
+    )
+    sink = Db2Sink(target, "compared", schema, ["id"])
+    merge_sql = str(sink.merge_upsert_from_table("ft", "lt", ["id"]))
+    assert (
+        "WHEN MATCHED AND (ft.name IS DISTINCT FROM lt.name OR "
+        'ft."_sdc_deleted_at" IS DISTINCT FROM lt."_sdc_deleted_at") THEN UPDATE'
+    ) in merge_sql
+    assert '_sdc_extracted_at" IS DISTINCT FROM' not in merge_sql
+
+    hashed = Db2Sink(target, "hashed", schema, ["id"])
+    assert ROW_HASH_COLUMN in hashed.schema["properties"]
+    merge_sql = str(hashed.merge_upsert_from_table("ft", "lt", ["id"]))
+    assert (
+        f'WHEN MATCHED AND (ft."{ROW_HASH_COLUMN}" IS DISTINCT FROM '
+        f'lt."{ROW_HASH_COLUMN}") THEN UPDATE'
+    ) in merge_sql
+    record = {"id": 1, "name": "a", "_sdc_extracted_at": "2024-01-01"}
+    row_hash = hashed.row_hash(record)
+    assert row_hash == hashed.row_hash({**record, "_sdc_extracted_at": "2024-01-02"})
+    assert row_hash != hashed.row_hash({**record, "name": "b"})
+
+    # date-times hash at their wall-clock time, parsed or not, e.g. by Arrow
+    offset = datetime.timezone(datetime.timedelta(hours=2))
+    deleted_at = [
+        "2024-01-02T03:04:05+02:00",
+        datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=offset),
+        datetime.datetime(2024, 1, 2, 3, 4, 5),  # noqa: DTZ001
+    ]
+    hashes = [hashed.row_hash({**record, "_sdc_deleted_at": d}) for d in deleted_at]
+    assert len(set(hashes)) == 1
+    later = {**record, "_sdc_deleted_at": "2024-01-02T03:04:06+02:00"}
+    assert hashed.row_hash(later) != hashes[0]
+
+
+def test_sparse_records_merge_only_present_columns() -> None:
+    """Test partial records are grouped by properties and merged by column."""
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            "a": {"type": ["string", "null"]},
+            "b": {"type": ["string", "null"]},
+        }
+    }
+    target = TargetDb2(
+        config={**SAMPLE_CONFIG, "sparse_records": True, "add_record_metadata": False}
+    )
+    sink = Db2Sink(target, "sparse", schema, ["id"])
+    context = sink._get_context({})  # noqa: SLF001
+    sink.start_batch(context)
+    for record in (
+        {"id": 1, "a": "x"},
+        {"id": 1, "b": "y"},
+        {"id": 2, "a": "z"},
+        {"b": "w", "id": 3},
+    ):
+        sink.process_record(record, context)
+
+    groups = {
+        tuple(group_schema["properties"]): list(group)
+        for group_schema, group in sink.group_by_properties(context["records"])
+    }
+    assert groups == {
+        ("id", "a", "b"): [{"id": 1, "a": "x", "b": "y"}],
+        ("id", "a"): [{"id": 2, "a": "z"}],
+        ("id", "b"): [{"b": "w", "id": 3}],
+    }
+    merge_sql = str(sink.merge_upsert_from_table("ft", "lt", ["id"], ["id", "b"]))
+    assert "SET b = lt.b\n" in merge_sql
+    assert "INSERT (id, b)" in merge_sql
+
+    # partial records are not hashed, as they lack columns of the row
+    target = TargetDb2(
+        config={**SAMPLE_CONFIG, "sparse_records": True, "change_detection": "row_hash"}
+    )
+    sink = Db2Sink(target, "sparse", schema, ["id"])
+    assert sink.change_detection == "columns"
+    assert ROW_HASH_COLUMN not in sink.schema["properties"]
+
+    # partial records are not buffered in columns, nor replaced on disk
+    for batch_buffer in ("disk", "columnar", "arrow"):
+        target = TargetDb2(
+            config={
+                **SAMPLE_CONFIG,
+                "sparse_records": True,
+                "batch_buffer": batch_buffer,
+                "add_record_metadata": False,
+            }
+        )
+        sink = Db2Sink(target, "sparse", schema, ["id"])
+        assert sink.batch_buffer == "memory"
+        assert not sink.datelike_converters
+        buffer = sink.create_record_buffer()
+        assert type(buffer) is RecordBuffer
+        buffer.append({"id": 1, "a": "x"})
+        buffer.append({"id": 1, "b": "y"})
+        assert list(buffer) == [{"id": 1, "a": "x", "b": "y"}]
+
+
+def test_auto_upsert_strategy(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the upsert strategy is chosen from the staged keys in the target."""
+    schema = {"properties": {"id": {"type": ["integer"]}, "a": {"type": ["string"]}}}
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "upsert_strategy": "auto",
+            "add_record_metadata": False,
+        }
+    )
+    sink = Db2Sink(target, "auto", schema, ["id"])
+    sink.__dict__["is_column_organized"] = False
+    columns = ["id", "a"]
+
+    conn = t.cast("Connection", None)
+
+    def choose(matched_rows: int, columns: list[str] = columns) -> str:
+        monkeypatch.setattr(sink, "count_matched_keys", lambda _: matched_rows)
+        return sink.choose_upsert_strategy(100, columns, PhaseTimer(), conn)
+
+    # rows of new keys may be inserted by others unless the table is locked
+    assert choose(0) == "update_insert"
+    sink.table_lock = "share"
+    assert choose(0) == "insert"
+    assert choose(10) == "update_insert"
+    assert choose(90) == "merge"
+    sink.__dict__["is_column_organized"] = True
+    assert choose(90) == "delete_insert"
+    # rows are not deleted & reinserted from partial records
+    assert choose(90, ["id"]) == "update_insert"
+
+    update_sql, insert_sql = (
+        str(stmt) for stmt in sink.generate_upsert_statements("update_insert", columns)
+    )
+    assert "SET (a) = (" in update_sql
+    assert "WHERE NOT EXISTS" in insert_sql
+    delete_sql, _ = sink.generate_upsert_statements("delete_insert", columns)
+    assert str(delete_sql).startswith("DELETE FROM")
+
+
+def test_auto_upsert_strategy_probed_after_lock(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test staged keys are counted in the upsert transaction, once locked."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "upsert_strategy": "auto",
+            "table_lock": "share",
+            "add_record_metadata": False,
+        }
+    )
+    sink = Db2Sink(target, "probed", schema, ["id"])
+    executed = []
+
+    transaction = SimpleNamespace(commit=lambda: executed.append("COMMIT"))
+    connection = SimpleNamespace(
+        execute=lambda statement: executed.append(str(statement).split()[0])
+        or SimpleNamespace(scalar=lambda: 0),
+        begin=lambda: contextlib.nullcontext(transaction),
+    )
+    monkeypatch.setattr(
+        sink.connector, "_connect", lambda: contextlib.nullcontext(connection)
+    )
+    monkeypatch.setattr(sink.connector, "create_empty_table", lambda *_, **__: None)
+    monkeypatch.setattr(sink, "stage_records", lambda *_: None)
+    buffer = sink.create_record_buffer()
+    buffer.append({"id": 1})
+    assert sink._upsert_records(buffer, sink.schema, PhaseTimer()) == "insert"  # noqa: SLF001
+    assert executed == ["LOCK", "SELECT", "INSERT", "DROP", "COMMIT"]
+
+
+def test_known_key_filter_routes_new_keys() -> None:
+    """Test the key filter has no false negatives, and splits new keys."""
+    known_keys = KeyFilter(capacity=1000)
+    for i in range(1000):
+        known_keys.add((i, "a"))
+    assert all((i, "a") in known_keys for i in range(1000))
+    false_positives = sum((i, "a") in known_keys for i in range(1000, 11000))
+    assert false_positives < 300
+    assert not known_keys.saturated
+
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    sink = Db2Sink(TargetDb2(config=SAMPLE_CONFIG), "known", schema, ["id"])
+    known_keys = KeyFilter(capacity=10)
+    known_keys.add((1,))
+    buffer = sink.create_record_buffer()
+    for i in (1, 2):
+        buffer.append({"id": i})
+    new_records, possible_matches, keys = sink.split_new_keys(buffer, known_keys)
+    assert list(new_records) == [{"id": 2}]
+    assert list(possible_matches) == [{"id": 1}]
+    assert keys == [(1,), (2,)]
+
+
+def test_upsert_in_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test large batches are upserted in chunks of `upsert_chunk_rows`."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    target = TargetDb2(config={**SAMPLE_CONFIG, "upsert_chunk_rows": 2})
+    sink = Db2Sink(target, "chunked", schema, ["id"])
+    chunks = []
+
+    def upsert(buffer: RecordBuffer, schema: dict, timer: PhaseTimer) -> str:
+        chunks.append([record["id"] for record in buffer])
+        return "merge"
+
+    monkeypatch.setattr(sink, "_upsert_records", upsert)
+    buffer = sink.create_record_buffer()
+    for i in range(5):
+        buffer.append({"id": i})
+    assert sink._upsert_batch(buffer, PhaseTimer()) == ["merge"] * 3  # noqa: SLF001
+    assert chunks == [[0, 1], [2, 3], [4]]
+
+
+def test_table_lock() -> None:
+    """Test only the final table is locked, in the configured mode."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    target = TargetDb2(config={**SAMPLE_CONFIG, "table_lock": "exclusive"})
+    sink = Db2Sink(target, "locked", schema, ["id"])
+    executed = []
+
+    class RecordingConnection:
+        def execute(self, statement: object) -> None:
+            executed.append(str(statement))
+
+    conn = t.cast("Connection", RecordingConnection())
+    sink.lock_table(conn, sink.full_load_table_name)
+    sink.lock_table(conn, sink.full_table_name)
+    assert len(executed) == 1
+    assert executed[0].endswith("locked IN EXCLUSIVE MODE")
+    assert sink.lock_wait_seconds > 0
+
+
+def test_hard_delete_statements() -> None:
+    """Test deleted keys are deleted with 1 statement before the upsert."""
+    schema = {"properties": {"id": {"type": ["integer"]}, "a": {"type": ["string"]}}}
+    target = TargetDb2(
+        config={**SAMPLE_CONFIG, "hard_delete": True, "add_record_metadata": True}
+    )
+    sink = Db2Sink(target, "deleted", schema, ["id"])
+    columns = list(sink.schema["properties"])
+    delete_sql, merge_sql = (
+        str(stmt) for stmt in sink.generate_upsert_statements("merge", columns)
+    )
+    assert delete_sql.startswith("DELETE FROM")
+    assert 'lt."_sdc_deleted_at" IS NOT NULL' in delete_sql
+    assert 'WHERE "_sdc_deleted_at" IS NULL) lt' in merge_sql
+    # without the deletion time column, e.g. for sparse records, nothing is deleted
+    (merge_sql,) = sink.generate_upsert_statements("merge", ["id", "a"])
+    assert "_sdc_deleted_at" not in str(merge_sql)
+
+
+@pytest.mark.parametrize("key_properties", [[], ["id"]])
+def test_batch_files_are_streamed(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    key_properties: list[str],
+) -> None:
+    """Test records of batch files are streamed, or upserted in batches."""
+    path = tmp_path / "batch.jsonl.gz"
+    with gzip.open(path, "wt") as file:
+        file.writelines(f'{{"id": {i % 4}, "v": {i}}}\n' for i in range(10))
+    target = TargetDb2(config={**SAMPLE_CONFIG, "batch_size_rows": 5})
+    schema = {"properties": {"id": {"type": ["integer"]}, "v": {"type": ["integer"]}}}
+    sink = Db2Sink(target, "batched", schema, key_properties)
+    batches = []
+    monkeypatch.setattr(
+        sink,
+        "_load_batch",
+        lambda buffer: batches.append((type(buffer), [rec["v"] for rec in buffer])),
+    )
+    sink.process_batch_files(
+        BaseBatchFileEncoding.from_dict({"format": "jsonl", "compression": "gzip"}),
+        [path.as_uri()],
+    )
+    if key_properties:
+        # the last record of each key is kept, per batch
+        assert batches == [(RecordBuffer, [4, 1, 2, 3]), (RecordBuffer, [9, 6, 7, 8])]
+        assert sink._total_records_written == 8  # noqa: SLF001
+    else:
+        assert batches == [(StreamedRecordBuffer, list(range(10)))]
+        assert sink._total_records_written == 10  # noqa: SLF001
+    assert sink.record_counter_metric.value == sink._total_records_written  # noqa: SLF001
+
+
+def test_json_stage_format() -> None:
+    """Test records staged as JSON are projected to typed columns."""
+    schema = {
+        "properties": {
+            "id": {"type": ["integer"]},
+            'say "hi"': {"type": ["boolean", "null"]},
+            "payload": {"type": ["object", "null"]},
+            "updated": {"type": ["string", "null"], "format": "date-time"},
+        }
+    }
+    target = TargetDb2(
+        config={**SAMPLE_CONFIG, "stage_format": "json", "add_record_metadata": False}
+    )
+    sink = Db2Sink(target, "shredded", schema, ["id"])
+    source = sink.staged_source(list(schema["properties"]))
+    assert source.startswith(
+        '(SELECT jt.id, CAST(jt."say ""hi""" AS BOOLEAN) AS "say ""hi""", '
+        "jt.payload, jt.updated\n"
+    )
+    assert "r.\"_sdc_record\", 'strict $' COLUMNS (" in source
+    assert "id INTEGER PATH 'lax $.\"id\"' NULL ON EMPTY ERROR ON ERROR" in source
+    assert '"say ""hi""" VARCHAR(5) PATH \'lax $."say \\"hi\\""\'' in source
+    assert "payload VARCHAR(10000) FORMAT JSON PATH 'lax $.\"payload\"'" in source
+    assert "updated TIMESTAMP PATH 'lax $.\"updated\"'" in source
+    # values not cast to their column's type raise an error, not NULL
+    column_defs = source.split("COLUMNS (\n")[1].split("\n  )")[0].split(",\n")
+    assert len(column_defs) == len(schema["properties"])
+    assert all(d.endswith(" NULL ON EMPTY ERROR ON ERROR") for d in column_defs)
+    (merge_sql,) = sink.generate_upsert_statements("merge", ["id"])
+    assert f"USING {sink.staged_source(['id'])} lt" in str(merge_sql)
+
+    record = {
+        "id": 1,
+        "at": datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        "amount": decimal.Decimal("1E-7"),
+        "data": {"a": [1]},
+    }
+    assert json.loads(sink.record_serializer(record)) == {
+        "id": 1,
+        "at": "2024-01-02-03.04.05.000000",
+        "amount": 0.0000001,
+        "data": {"a": [1]},
+    }
+
+
+@pytest.mark.parametrize("library", ["orjson", "json"])
+def test_record_serializer_keeps_decimals_as_numbers(library: str) -> None:
+    """Test nested decimals of staged records round-trip as JSON numbers."""
+    pytest.importorskip(library)
+    serialize = get_record_serializer(library)
+    record = {
+        "id": 1,
+        "amount": decimal.Decimal("1.10"),
+        "on": datetime.date(2024, 1, 2),
+        "data": {"prices": [decimal.Decimal("1E-7"), decimal.Decimal("2.50")]},
+    }
+    serialized = serialize(record)
+    assert "0.0000001" in serialized
+    assert json.loads(serialized, parse_float=decimal.Decimal) == {
+        **record,
+        "on": "2024-01-02",
+    }
+
+
+def test_overwrite_loads_shadow_table(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test overwrite loads go to a shadow table, swapped in once per sync."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    target = TargetDb2(config={**SAMPLE_CONFIG, "load_method": "overwrite"})
+    replaced = []
+    dropped = []
+    monkeypatch.setattr(
+        DB2Connector,
+        "replace_table",
+        lambda _, *table_names: replaced.append(tuple(map(str, table_names))),
+    )
+    monkeypatch.setattr(
+        DB2Connector,
+        "drop_tables_created_before",
+        lambda _, table_name, prefix, suffix_size: dropped.append(
+            (str(table_name), prefix + "?" * suffix_size)
+        ),
+    )
+    # the sink of the stream is replaced, e.g. on a schema change
+    sinks = []
+    for _ in range(2):
+        sink = Db2Sink(target, "overwritten", schema, ["id"])
+        target.shadow_tables[sink.full_live_table_name] = sink
+        sinks.append(sink)
+    sink = sinks[-1]
+    assert sink.shadow_table_name == sinks[0].shadow_table_name
+    assert re.fullmatch(r"shadow_overwritten_[a-z]{5}", sink.shadow_table_name)
+    assert str(sink.full_table_name).endswith("." + sink.shadow_table_name)
+    assert str(sink.full_live_table_name).endswith(".overwritten")
+    # overlapping syncs load their own shadow table
+    other_target = TargetDb2(config={**SAMPLE_CONFIG, "load_method": "overwrite"})
+    other_sink = Db2Sink(other_target, "overwritten", schema, ["id"])
+    assert other_sink.shadow_table_name != sink.shadow_table_name
+
+    # the organization of the table loaded is checked, not of the live table
+    queried = []
+    connection = SimpleNamespace(
+        execute=lambda _, params: queried.append(params)
+        or SimpleNamespace(scalar=lambda: "C")
+    )
+    monkeypatch.setattr(
+        sink.connector, "_connect", lambda: contextlib.nullcontext(connection)
+    )
+    assert sink.is_column_organized
+    assert [params["table_name"] for params in queried] == [sink.shadow_table_name]
+
+    for sink in sinks:
+        sink.clean_up()
+    assert replaced == [(str(sink.full_live_table_name), str(sink.full_table_name))]
+    assert dropped == [(str(sink.full_live_table_name), "shadow_overwritten_?????")]
+    assert not target.shadow_tables
+
+
+def test_version_cleanup_statements() -> None:
+    """Test rows of old versions are deleted or marked deleted, in chunks."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    config = {**SAMPLE_CONFIG, "add_record_metadata": True}
+    sink = Db2Sink(TargetDb2(config=config), "versioned", schema, ["id"])
+    update_sql = str(sink.generate_version_cleanup_statement())
+    assert update_sql.startswith("UPDATE")
+    assert '"_sdc_table_version" < :version AND "_sdc_deleted_at" IS NULL' in update_sql
+    update_stmt = sink.generate_version_cleanup_statement(1000)
+    assert str(update_stmt).startswith("UPDATE (")
+    assert "FETCH FIRST 1000 ROWS ONLY" in str(update_stmt)
+    assert isinstance(update_stmt._bindparams["deleted_at"].type, sa.TIMESTAMP)  # noqa: SLF001
+
+    config["hard_delete"] = True
+    sink = Db2Sink(TargetDb2(config=config), "versioned", schema, ["id"])
+    delete_sql = str(sink.generate_version_cleanup_statement(1000))
+    assert delete_sql.startswith("DELETE FROM (")
+    assert "_sdc_deleted_at" not in delete_sql
+
+
+def test_version_index(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the version & soft delete columns are indexed once."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    config = {**SAMPLE_CONFIG, "add_record_metadata": True}
+    sink = Db2Sink(TargetDb2(config=config), "versioned", schema, ["id"])
+    indexes: list[dict] = []
+    queries: list[str] = []
+    monkeypatch.setattr(
+        sa, "inspect", lambda _: SimpleNamespace(get_indexes=lambda *_, **__: indexes)
+    )
+    monkeypatch.setattr(
+        sink.connector,
+        "execute_queries",
+        lambda stmts: queries.extend(str(stmt) for stmt in stmts),
+    )
+    sink.create_version_index()
+    (create_sql,) = queries
+    assert 'ix_versioned_version_deleted ON "DB2INST1".versioned (' in create_sql
+    assert create_sql.endswith('("_sdc_table_version", "_sdc_deleted_at")')
+
+    # an index of the version column only does not find undeleted rows
+    indexes.append({"column_names": ["_sdc_table_version"]})
+    sink.create_version_index()
+    assert len(queries) == 2
+    indexes.append({"column_names": ["_sdc_table_version", "_sdc_deleted_at"]})
+    sink.create_version_index()
+    assert len(queries) == 2
+
+
+def test_load_from_cursor_engine(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test records are staged, loaded with LOAD, and rejected rows logged."""
+    schema = {"properties": {"id": {"type": ["integer"]}}}
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "load_engine": "load_from_cursor",
+            "add_record_metadata": False,
+        }
+    )
+    sink = Db2Sink(target, "loaded", schema, [])
+    calls = []
+    counts = {"ROWS_LOADED": 2, "ROWS_REJECTED": 0}
+    monkeypatch.setattr(
+        sink.connector,
+        "create_empty_table",
+        lambda full_table_name, **_: calls.append(("create", full_table_name)),
+    )
+    monkeypatch.setattr(
+        sink,
+        "stage_records",
+        lambda full_table_name, _: calls.append(("stage", full_table_name)),
+    )
+    monkeypatch.setattr(
+        sink.connector,
+        "load_from_cursor",
+        lambda full_table_name, query, _: calls.append(("load", full_table_name, query))
+        or counts,
+    )
+    monkeypatch.setattr(
+        sink.connector, "execute_queries", lambda _: calls.append(("drop",))
+    )
+    buffer = sink.create_record_buffer()
+    buffer.append({"id": 1})
+    sink.insert_records(buffer, PhaseTimer())
+    load_table = sink.full_load_table_name
+    assert calls == [
+        ("create", load_table),
+        ("stage", load_table),
+        (
+            "load",
+            sink.full_table_name,
+            f"SELECT id FROM {sink.connector.quote(load_table)}",
+        ),
+        ("drop",),
+    ]
+
+    # the loaded rows were committed, and would be loaded again on a rerun
+    counts["ROWS_REJECTED"] = 1
+    errors = []
+    monkeypatch.setattr(
+        sink.logger, "error", lambda msg, *args: errors.append(msg % args)
+    )
+    sink.insert_records(buffer, PhaseTimer())
+    assert errors == [
+        f"Rejected 1 of 1 records of 'loaded' loaded to {sink.full_table_name}, "
+        "the other records were loaded."
+    ]
+
+
+def test_write_delimited() -> None:
+    """Test values are escaped & formatted as fields of a DEL file."""
+    file = io.StringIO()
+    rows = [
+        ['say "hi"', "", None, True, 1.5e-7],
+        [
+            '{"a": "b,\nc"}',
+            datetime.datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc),
+            None,
+            0,
+            1,
+        ],
+    ]
+    assert write_delimited(file, rows) == 2
+    assert file.getvalue() == (
+        '"say ""hi""","",,1,0.00000015\n'
+        '"{""a"": ""b,\nc""}",2024-01-02-03.04.05.000006,,0,1\n'
+    )
+    # not written as Infinity or NaN, which numeric columns reject
+    for value in (float("inf"), float("-inf"), float("nan"), decimal.Decimal("NaN")):
+        with pytest.raises(ValueError, match="non-finite number"):
+            write_delimited(io.StringIO(), [[1, value]])
+
+
+@pytest.mark.parametrize(
+    ("engine", "utility"),
+    [("load_from_file", "LOAD"), ("import_from_file", "IMPORT")],
+)
+def test_file_load_engine(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    engine: str,
+    utility: str,
+) -> None:
+    """Test records are loaded from a file, kept only if rows are rejected."""
+    schema = {"properties": {"id": {"type": ["integer"]}, "data": {"type": ["object"]}}}
+    target = TargetDb2(
+        config={
+            **SAMPLE_CONFIG,
+            "load_engine": engine,
+            "add_record_metadata": False,
+            "bulk_load_directory": str(tmp_path),
+            "bulk_load_server_directory": "/shared",
+        }
+    )
+    sink = Db2Sink(target, "loaded", schema, ["id"])
+    loads = []
+    counts = {"ROWS_READ": 1, "ROWS_REJECTED": 0}
+
+    def load_from_file(
+        full_table_name: str, path: str, columns: list, utility: str
+    ) -> dict:
+        content = (tmp_path / path[len("/shared/") :]).read_text()
+        loads.append((full_table_name, columns, utility, content))
+        return counts
+
+    monkeypatch.setattr(sink.connector, "load_from_file", load_from_file)
+    buffer = sink.create_record_buffer()
+    buffer.append({"id": 1, "data": {"a": '"b"'}})
+    sink.stage_records(sink.full_load_table_name, buffer)
+    assert loads == [
+        (
+            sink.full_load_table_name,
+            ["id", "data"],
+            utility,
+            '1,"{""a"":""\\""b\\""""}"\n',
+        )
+    ]
+    assert not list(tmp_path.iterdir())
+
+    counts["ROWS_REJECTED"] = 1
+    with pytest.raises(RuntimeError, match="Rejected 1 of 1 records"):
+        sink.stage_records(sink.full_load_table_name, buffer)
+    assert len(list(tmp_path.iterdir())) == 1
+    # rows loaded to the final table were committed, so rejects are logged
+    sink.stage_records(str(sink.full_table_name), buffer)
+    assert len(list(tmp_path.iterdir())) == 2